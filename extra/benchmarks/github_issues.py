@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""Benchmark the github_issues transform on a synthetic changelog.
+
+Usage::
+
+    $ python extra/benchmarks/github_issues.py [entries]
+
+"""
+
+import os
+import re
+import sys
+import time
+from types import SimpleNamespace
+
+from docutils import nodes
+from docutils.frontend import get_default_settings
+from docutils.parsers.rst import Parser
+from docutils.utils import new_document
+
+from sphinx.addnodes import pending_xref
+
+# so it runs from a checkout without installing the package.
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+
+from sphinx_celery.github_issues import Issues  # noqa: E402
+
+DEFAULT_ENTRIES = 50000
+PATTERN = re.compile(r'[Ii]ssue #(\d+)')
+
+ENTRIES = [
+    'Worker: Fixed crash when the connection is lost (Issue #{0}).',
+    'Contributed by Some Author.',
+    'Beat: Now supports timezone aware schedules.',
+    'Documentation improvements.',
+    'Redis: The visibility timeout option is now respected.',
+]
+
+
+def make_document(entries):
+    settings = get_default_settings(Parser)
+    settings.env = SimpleNamespace(
+        config=SimpleNamespace(
+            github_project='celery/celery',
+            github_issue_pattern=PATTERN,
+            github_issue_patterns=[],
+            github_issue_references='xref',
+        ),
+        temp_data={},
+        docname='changelog',
+    )
+    document = new_document('changelog', settings)
+    bullets = nodes.bullet_list()
+    for i in range(entries):
+        text = ENTRIES[i % len(ENTRIES)].format(i)
+        bullets += nodes.list_item('', nodes.paragraph(
+            '', '',
+            nodes.Text(text),
+            nodes.literal('', 'task_acks_late'),
+            nodes.Text(' and '),
+            nodes.strong('', 'broker_url'),
+            nodes.Text(f' ({i}).'),
+        ))
+    document += bullets
+    return document
+
+
+def baseline(document):
+    # The transform before the literal pre-filter was added.
+    for node in list(document.findall(nodes.Text)):
+        parent = node.parent
+        if isinstance(parent, (nodes.literal, nodes.FixedTextElement)):
+            continue
+        text = str(node)
+        new_nodes = []
+        last_issue_ref_end = 0
+        for match in PATTERN.finditer(text):
+            head = text[last_issue_ref_end:match.start()]
+            if head:
+                new_nodes.append(nodes.Text(head))
+            last_issue_ref_end = match.end()
+            refnode = pending_xref()
+            refnode['reftarget'] = match.group(1)
+            refnode['reftype'] = 'issue'
+            refnode['refdomain'] = 'github'
+            refnode['github_project'] = 'celery/celery'
+            refnode.append(nodes.inline(
+                match.group(0), match.group(0), classes=['xref', 'issue']))
+            new_nodes.append(refnode)
+        if not new_nodes:
+            continue
+        tail = text[last_issue_ref_end:]
+        if tail:
+            new_nodes.append(nodes.Text(tail))
+        parent.replace(node, new_nodes)
+
+
+def timeit(fun, entries, repeat=3):
+    best = None
+    for _ in range(repeat):
+        document = make_document(entries)
+        start = time.perf_counter()
+        fun(document)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    entries = int(argv[0]) if argv else DEFAULT_ENTRIES
+    before = timeit(baseline, entries)
+    after = timeit(lambda document: Issues(document).apply(), entries)
+    print(f'{entries} entries: {before:.3f}s before, {after:.3f}s after '
+          f'({before / after:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -111,9 +111,11 @@ setup(
     package_data={
         'sphinx_celery': [
             'theme.conf',
+            'searchshards.html',
         ],
         os.path.join('sphinx_celery', 'static'): [
             'celery.css_t',
+            'searchshards.js',
         ],
         os.path.join('sphinx_celery', 'templates'): [
             'page.html',
@@ -44,3 +44,8 @@ def setup(app):
         'sphinx_celery',
         os.path.abspath(os.path.dirname(__file__)),
     )
+    from . import cssbundle, searchshards
+    app.connect('builder-inited', cssbundle.bundle_stylesheet)
+    app.connect('html-page-context', cssbundle.replace_stylesheet)
+    app.connect('html-page-context', searchshards.select_template)
+    app.connect('build-finished', searchshards.write_shards)
@@ -54,18 +54,108 @@ List of domains to check.
 
 Default is ``['py']`` and Python is the only domain currently supported.
 
+apicheck_module_index
+~~~~~~~~~~~~~~~~~~~~~
+
+Keep an index of the package directory tree in the doctree directory,
+so that subsequent runs only rescan directories that changed.
+
+If the package is installed from a wheel the module list is read
+from the ``RECORD`` file of the distribution instead,
+and no directories are scanned at all.
+
+Default is :const:`True`.
+
+apicheck_static
+~~~~~~~~~~~~~~~
+
+Also check that all public classes and functions are documented,
+by parsing the module sources instead of importing them.
+
+Public objects are the classes and functions defined at module level
+that are listed in ``__all__``, or that do not start with an underscore
+if the module has no ``__all__``.
+
+Default is :const:`False`.
+
+apicheck_static_workers
+~~~~~~~~~~~~~~~~~~~~~~~
+
+Number of processes used to parse the module sources in static mode.
+
+Default is :const:`None` (the number of CPUs).
+
+apicheck_on_build
+~~~~~~~~~~~~~~~~~
+
+Also run the check at the end of every other build (e.g. ``html``),
+instead of running ``sphinx-build -b apicheck`` separately.
+
+The report is written to the ``apicheck`` subdirectory of the output
+directory, and the exit status of ``sphinx-build`` is set if the check fails.
+
+Default is :const:`False`.
+
+apicheck_report_formats
+~~~~~~~~~~~~~~~~~~~~~~~
+
+List of report formats to write to the output directory,
+any of ``pickle``, ``jsonl`` (JSON Lines) and ``junit`` (JUnit XML).
+
+Default is ``['pickle']``.
+
+apicheck_git_range
+~~~~~~~~~~~~~~~~~~
+
+Only check modules changed in this git revision range,
+as computed by :command:`git diff` in the repository of the package.
+
+Example:
+
+.. code-block:: console
+
+    $ sphinx-build -b apicheck -D apicheck_git_range=main...HEAD \
+        -d _build/doctrees . _build/apicheck
+
+Default is :const:`None` (check all modules).
+
+apicheck_import_profile
+~~~~~~~~~~~~~~~~~~~~~~~
+
+Record the wall time, memory allocated and tree of nested imports
+of every module imported by ``automodule``, and write them sorted
+by time to ``import_profile.txt`` and ``import_profile.json``
+in the output directory of the apicheck report.
+
+The report is written at the end of every build, also when documents
+are read in parallel.
+
+Default is :const:`False`.
+
 """
 
-import importlib
+import ast
+import importlib.util
 import os
+import pickle
+import posixpath
+import subprocess
+import sys
+import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 import sphinx
 from sphinx.ext import autodoc
+from sphinx.util import logging
 from sphinx.util.console import bold, darkgreen, green, red
 
-from .builders import BaseBuilder
-from .utils import bytes_if_py2
+from .builders import BaseBuilder, get_report_dir, run_check_on_build
+from .git import changed_files, module_for_path
+from .importprofile import ImportProfiler, write_import_profile
+from .utils import (
+    bytes_if_py2, get_env_store, per_document_env_store,
+)
 
 DEFAULT_IGNORE = [r'.*?\.tests.*']
 
@@ -75,6 +165,7 @@ SUBHEADER = '-'
 ERR = 'ERROR'
 ERR_MISSING = '{error}: In index but module does not exist: {module}'
 ERR_UNDOCUMENTED = 'Undocumented Autodoc Modules'
+ERR_UNDOCUMENTED_OBJECTS = 'Undocumented Autodoc Objects'
 OK_STATUS = 'OK: All modules documented :o)'
 
 NOK_STATUS = """
@@ -91,17 +182,57 @@ DOMAIN_FORMAT = """\
 
 MODULE_FORMAT = '- {module}'
 
+COVERAGE_FORMAT = (
+    '{domain}: {documented} of {total} objects documented ({percent:.1f}%)')
+
+MODULE_INDEX_FILENAME = 'apicheck.modules.pickle'
+
+ERR_GIT_RANGE = 'apicheck: Cannot read changes in {0!r}, checking all: {1}'
+
+logger = logging.getLogger(__name__)
+
 
 class ModuleDocumenter(autodoc.ModuleDocumenter):
-    missing_modules = set()
 
-    def import_object(self):
-        if not super().import_object():
-            self.missing_modules.add(self.modname)
+    def import_object(self, raiseerror=False):
+        if self.config.apicheck_import_profile:
+            with ImportProfiler() as profiler:
+                imported = super().import_object(raiseerror)
+            add_import_profile(
+                self.env, self.env.docname, profiler.as_dict(self.modname))
+        else:
+            imported = super().import_object(raiseerror)
+        if not imported:
+            add_missing_module(self.env, self.env.docname, self.modname)
             return False
         return True
 
 
+def add_missing_module(env, docname, module):
+    get_env_store(env, 'apicheck_missing_modules').setdefault(
+        docname, set()).add(module)
+
+
+def get_missing_modules(env):
+    return sorted(set().union(
+        *get_env_store(env, 'apicheck_missing_modules').values()))
+
+
+def add_import_profile(env, docname, profile):
+    get_env_store(env, 'apicheck_import_profiles').setdefault(
+        docname, []).append(profile)
+
+
+def write_import_profiles(app, exception):
+    profiles = get_env_store(app.env, 'apicheck_import_profiles')
+    if exception is None and app.config.apicheck_import_profile:
+        write_import_profile(
+            [profile for docprofiles in profiles.values()
+             for profile in docprofiles],
+            get_report_dir(app, APICheckBuilder.name),
+        )
+
+
 def title(s, spacing=2, sep=TITLEHEADER):
     return '\n'.join([
         sep * (len(s) + spacing),
@@ -114,23 +245,185 @@ def header(s, sep=SUBHEADER):
     return '\n'.join([bold(s), sep * len(s)])
 
 
-def find_python_modules(package):
-    if isinstance(package, str):
-        package = importlib.import_module(package)
-    name, path = package.__name__, package.__file__
-    current_dist_depth = len(name.split('.')) - 1
-    current_dist = os.path.join(os.path.dirname(path),
-                                *([os.pardir] * current_dist_depth))
-    abs = os.path.abspath(current_dist)
-    dist_name = os.path.basename(abs)
+class ModuleIndex:
+    """Directory listings of a package tree keyed by directory mtime.
+
+    Only directories where the mtime changed since the last run
+    are listed again, the rest is served from the pickled index.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.dirs = {}
+        self.visited = set()
+        self.load()
+
+    def load(self):
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, mode='rb') as fh:
+                    self.dirs = pickle.load(fh)
+            except Exception:
+                self.dirs = {}
+
+    def save(self):
+        if self.path and self.visited:
+            dirs = {k: v for k, v in self.dirs.items() if k in self.visited}
+            with open(self.path, mode='wb') as fh:
+                pickle.dump(dirs, fh)
+
+    def scan(self, dirpath):
+        self.visited.add(dirpath)
+        mtime = os.stat(dirpath).st_mtime_ns
+        cached = self.dirs.get(dirpath)
+        if cached is not None and cached[0] == mtime:
+            return cached[1], cached[2]
+        subdirs, filenames = [], []
+        with os.scandir(dirpath) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name.isidentifier():
+                        subdirs.append(entry.name)
+                elif entry.name.endswith('.py'):
+                    filenames.append(entry.name)
+        subdirs.sort()
+        filenames.sort()
+        self.dirs[dirpath] = (mtime, subdirs, filenames)
+        return subdirs, filenames
+
+
+def find_record_modules(name, path):
+    # List the modules of an installed package using the RECORD file
+    # of its distribution, returns None if there's no such distribution.
+    try:
+        from importlib import metadata
+    except ImportError:  # pragma: no cover
+        return None
+    sitedir = os.path.join(path, *([os.pardir] * len(name.split('.'))))
+    prefix = name.replace('.', '/') + '/'
+    for dist in metadata.distributions(path=[os.path.abspath(sitedir)]):
+        record = dist.read_text('RECORD')
+        if not record:
+            continue
+        files = {line.split(',', 1)[0] for line in record.splitlines()}
+        if prefix + '__init__.py' not in files:
+            continue
+        packages = {
+            posixpath.dirname(f) for f in files
+            if f.startswith(prefix) and f.endswith('/__init__.py')
+        }
+        # Only include packages reachable through other packages,
+        # same as when walking the directory tree.
+        packages = {
+            p for p in packages
+            if all(parent in packages for parent in _parents(p, prefix))
+        }
+        return sorted(
+            dirname.replace('/', '.') if filename == '__init__.py'
+            else f[:-3].replace('/', '.')
+            for f in files if f.endswith('.py')
+            for dirname, filename in [posixpath.split(f)]
+            if dirname in packages
+        )
+
+
+def _parents(path, prefix):
+    while len(path) >= len(prefix):
+        path = posixpath.dirname(path)
+        yield path
+
+
+def walk_package_modules(name, path, index):
+    stack = [(name, path)]
+    while stack:
+        package, dirpath = stack.pop()
+        subdirs, filenames = index.scan(dirpath)
+        if '__init__.py' not in filenames:
+            continue
+        yield package
+        for filename in filenames:
+            if filename != '__init__.py':
+                yield '.'.join([package, filename[:-3]])
+        stack.extend(
+            ('.'.join([package, subdir]), os.path.join(dirpath, subdir))
+            for subdir in reversed(subdirs)
+        )
+
 
-    for dirpath, _, filenames in os.walk(abs):
-        package = (dist_name + dirpath[len(abs):]).replace('/', '.')
-        if '__init__.py' in filenames:
-            yield package
-            for filename in filenames:
-                if filename.endswith('.py') and filename != '__init__.py':
-                    yield '.'.join([package, filename])[:-3]
+def locate_module(module):
+    # Find the filename of a module, without importing it if possible.
+    if not isinstance(module, str):
+        return (module.__name__, module.__file__,
+                hasattr(module, '__path__'))
+    if module in sys.modules:
+        return locate_module(sys.modules[module])
+    top, _, rest = module.partition('.')
+    spec = importlib.util.find_spec(top)
+    if spec is None or not spec.origin:
+        raise ImportError(f'No module named {module!r}', name=module)
+    path = spec.origin
+    for part in rest.split('.') if rest else []:
+        dirname = os.path.dirname(path)
+        path = os.path.join(dirname, part, '__init__.py')
+        if not os.path.exists(path):
+            path = os.path.join(dirname, part + '.py')
+    if not os.path.exists(path):
+        raise ImportError(f'No module named {module!r}', name=module)
+    return module, path, os.path.basename(path) == '__init__.py'
+
+
+def find_python_modules(package, index=None):
+    name, path, is_package = locate_module(package)
+    if not is_package:
+        yield name
+        return
+    path = os.path.abspath(os.path.dirname(path))
+    modules = find_record_modules(name, path)
+    if modules is None:
+        modules = walk_package_modules(
+            name, path, index if index is not None else ModuleIndex())
+    yield from modules
+
+
+def parse_python_objects(module_and_path):
+    module, path = module_and_path
+    try:
+        with open(path, mode='rb') as fh:
+            tree = ast.parse(fh.read(), path)
+    except (OSError, SyntaxError, ValueError):
+        return module, []
+    defined = list(dict.fromkeys(
+        node.name for node in tree.body
+        if isinstance(node, (ast.ClassDef,
+                             ast.FunctionDef,
+                             ast.AsyncFunctionDef))
+    ))
+    public = _module_all(tree)
+    if public is None:
+        return module, [name for name in defined if not name.startswith('_')]
+    return module, [name for name in defined if name in public]
+
+
+def _module_all(tree):
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+                isinstance(target, ast.Name) and target.id == '__all__'
+                for target in node.targets):
+            try:
+                return set(ast.literal_eval(node.value))
+            except ValueError:
+                return None
+
+
+def find_python_objects(modules, workers=None):
+    paths = [(module, locate_module(module)[1]) for module in modules]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(paths) < 2:
+        return dict(map(parse_python_objects, paths))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(paths) // (workers * 4))
+        return dict(executor.map(
+            parse_python_objects, paths, chunksize=chunksize))
 
 
 class APICheckBuilder(BaseBuilder):
@@ -142,43 +435,120 @@ class APICheckBuilder(BaseBuilder):
         'py': find_python_modules,
     }
 
+    find_objects = {
+        'py': find_python_objects,
+    }
+
     def init(self):
-        self.ignore_patterns = self.compile_regexes(
+        self.ignore_matcher = self.compile_matcher(
             self.config.apicheck_ignore_modules + DEFAULT_IGNORE,
         )
         self.check_domains = self.config.apicheck_domains
         self.check_package = (
             self.config.apicheck_package or self.config.project.lower())
 
+        self.module_index = ModuleIndex(
+            os.path.join(self.doctreedir, MODULE_INDEX_FILENAME)
+            if self.config.apicheck_module_index else None,
+        )
+
+        self.report_formats = self.config.apicheck_report_formats
+        self.git_range = self.config.apicheck_git_range
+        self.changed_modules = None
+        self.static = self.config.apicheck_static
+        workers = self.config.apicheck_static_workers
+        # values given with -D are strings.
+        self.static_workers = int(workers) if workers else None
+
         self.undocumented = defaultdict(list)
+        self.undocumented_objects = defaultdict(list)
+        self.object_coverage = {}
         self.all_modules = defaultdict(set)
 
     def is_ignored_module(self, module):
-        return any(regex.match(module) for regex in self.ignore_patterns)
+        return self.ignore_matcher(module)
+
+    def in_scope(self, module):
+        return self.changed_modules is None or module in self.changed_modules
+
+    def find_changed_modules(self, revrange):
+        name, path, is_package = locate_module(self.check_package)
+        try:
+            files = changed_files(revrange, os.path.dirname(path))
+        except (OSError, subprocess.CalledProcessError) as exc:
+            logger.warning(ERR_GIT_RANGE.format(
+                revrange, getattr(exc, 'stderr', None) or exc))
+            return None
+        if not is_package:
+            path = os.path.abspath(path)
+            return {name} if path in files else set()
+        package_path = os.path.abspath(os.path.dirname(path))
+        return {
+            module for module in (
+                module_for_path(f, name, package_path) for f in files)
+            if module is not None
+        }
 
     def write(self, *ignored):
+        if self.git_range:
+            self.changed_modules = self.find_changed_modules(self.git_range)
         for domain in self.check_domains:
             self.build_coverage(domain)
+        self.module_index.save()
         self.check_missing()
         if not self.app.statuscode:
             self.write_coverage(self.check_domains)
 
     def build_coverage(self, domain):
+        start = time.monotonic()
         self.all_modules[domain].update(self.find_modules[domain](
-            self.check_package,
+            self.check_package, index=self.module_index,
         ))
-        self.undocumented[domain].extend(self.find_undocumented(
+        undocumented = list(self.find_undocumented(
             domain, self.env.domaindata[domain]['modules'],
         ))
+        self.undocumented[domain].extend(undocumented)
+        self.report(
+            'undocumented', domain, undocumented, time.monotonic() - start)
+        if self.static and domain in self.find_objects:
+            start = time.monotonic()
+            undocumented = list(self.find_undocumented_objects(
+                domain, self.env.domaindata[domain]['objects'],
+            ))
+            self.undocumented_objects[domain].extend(undocumented)
+            self.report('undocumented_objects', domain, undocumented,
+                        time.monotonic() - start)
 
     def find_undocumented(self, domain, documented):
         return (
             mod for mod in self.all_modules[domain]
-            if mod not in documented and not self.is_ignored_module(mod)
+            if mod not in documented and self.in_scope(mod) and
+            not self.is_ignored_module(mod)
+        )
+
+    def find_undocumented_objects(self, domain, documented):
+        objects = self.find_objects[domain](
+            sorted(mod for mod in self.all_modules[domain]
+                   if self.in_scope(mod) and
+                   not self.is_ignored_module(mod)),
+            workers=self.static_workers,
         )
+        names = [
+            '.'.join([mod, obj])
+            for mod, objs in sorted(objects.items()) for obj in objs
+        ]
+        names = [name for name in names if not self.is_ignored_module(name)]
+        undocumented = [name for name in names if name not in documented]
+        self.object_coverage[domain] = (
+            len(names) - len(undocumented), len(names))
+        return undocumented
 
     def write_coverage(self, domains):
-        status = any(self.undocumented.values())
+        status = (any(self.undocumented.values()) or
+                  any(self.undocumented_objects.values()))
+        for domain in domains:
+            if domain in self.object_coverage:
+                print(self.format_object_coverage(domain))
         if status:
             self.app.statuscode = 2
             print(self.format_undocumented_domains(domains))
@@ -186,7 +556,13 @@ class APICheckBuilder(BaseBuilder):
             print(green(OK_STATUS))
 
     def check_missing(self):
-        for mod in ModuleDocumenter.missing_modules:
+        start = time.monotonic()
+        missing = [
+            mod for mod in get_missing_modules(self.env)
+            if self.in_scope(mod)
+        ]
+        self.report('missing', 'py', missing, time.monotonic() - start)
+        for mod in missing:
             self.app.statuscode = 3
             print(ERR_MISSING.format(
                 error=red(ERR),
@@ -194,28 +570,55 @@ class APICheckBuilder(BaseBuilder):
             ))
 
     def format_undocumented_domains(self, domains):
-        return NOK_STATUS.format(
-            title=title(ERR_UNDOCUMENTED),
-            undocumented='\n'.join(
-                self.format_undocumented_domain(domain) for domain in domains
-            ),
+        sections = [
+            (section_title, undocumented) for section_title, undocumented in [
+                (ERR_UNDOCUMENTED, self.undocumented),
+                (ERR_UNDOCUMENTED_OBJECTS, self.undocumented_objects),
+            ] if any(undocumented.values())
+        ]
+        return '\n'.join(
+            NOK_STATUS.format(
+                title=title(section_title),
+                undocumented='\n'.join(
+                    self.format_undocumented_domain(domain, undocumented)
+                    for domain in domains if undocumented[domain]
+                ),
+            )
+            for section_title, undocumented in sections
         )
 
-    def format_undocumented_domain(self, domain):
+    def format_undocumented_domain(self, domain, undocumented=None):
+        if undocumented is None:
+            undocumented = self.undocumented
         return DOMAIN_FORMAT.format(domain=header(domain), modules='\n'.join(
             self.format_undocumented_module(module)
-            for module in self.undocumented[domain]
+            for module in undocumented[domain]
         ))
 
+    def format_object_coverage(self, domain):
+        documented, total = self.object_coverage[domain]
+        return COVERAGE_FORMAT.format(
+            domain=domain, documented=documented, total=total,
+            percent=100.0 * documented / total if total else 100.0,
+        )
+
     def format_undocumented_module(self, module):
         return MODULE_FORMAT.format(module=darkgreen(module))
 
     def as_dict(self):
         return {
             'undocumented': dict(self.undocumented),
+            'undocumented_objects': dict(self.undocumented_objects),
+            'object_coverage': dict(self.object_coverage),
         }
 
 
+def check_on_build(app, exception):
+    if (exception is None and app.config.apicheck_on_build and
+            app.builder.name != APICheckBuilder.name):
+        run_check_on_build(app, APICheckBuilder.name)
+
+
 def _add_documenter_override(app, cls):
     # Install documenter for automodule without generating warning.
     from sphinx.ext.autodoc.directive import AutodocDirective
@@ -242,7 +645,25 @@ def setup(app):
         bytes_if_py2('apicheck_domains'), ['py'], False)
     app.add_config_value(
         bytes_if_py2('apicheck_package'), None, False)
+    app.add_config_value(
+        bytes_if_py2('apicheck_module_index'), True, False)
+    app.add_config_value(
+        bytes_if_py2('apicheck_static'), False, False)
+    app.add_config_value(
+        bytes_if_py2('apicheck_static_workers'), None, False)
+    app.add_config_value(
+        bytes_if_py2('apicheck_on_build'), False, False)
+    app.add_config_value(
+        bytes_if_py2('apicheck_report_formats'), ['pickle'], False)
+    app.add_config_value(
+        bytes_if_py2('apicheck_git_range'), None, False)
+    app.add_config_value(
+        bytes_if_py2('apicheck_import_profile'), False, False)
     _add_documenter_override(app, ModuleDocumenter)
+    per_document_env_store(app, 'apicheck_missing_modules')
+    per_document_env_store(app, 'apicheck_import_profiles')
+    app.connect('build-finished', check_on_build)
+    app.connect('build-finished', write_import_profiles)
 
     return {
         'parallel_read_safe': True,
@@ -1,24 +1,123 @@
-from sphinx.ext import autodoc as _autodoc
-from sphinx.util import inspect
+"""Signatures of wrapped functions and Celery tasks for autodoc.
 
+Autodoc falls back to an empty or ``(*args, **kwargs)`` signature for
+objects where it cannot follow the ``__wrapped__`` chain, like task
+proxies and some decorators.  For those the signature of the
+innermost function is used instead.  Tasks always use the signature
+of the task function, without ``self`` for bound tasks.
 
-def wrapped_getargspec(fun, *args, **kwargs):
-    while 1:
-        try:
-            wrapped = fun.__wrapped__
-            if wrapped is fun:
-                break
-            fun = wrapped
-        except AttributeError:
-            break
-    return inspect.getargspec(fun, *args, **kwargs)
+Resolved signatures are cached by object for the whole build, so
+objects documented in several places (e.g. ``autoclass`` members and
+``autofunction`` aliases) are only resolved once.
+"""
 
+import inspect
 
-_autodoc.getargspec = wrapped_getargspec
+from sphinx.util import logging
+from sphinx.util.inspect import (signature, stringify_annotation,
+                                 stringify_signature)
+
+#: Signatures autodoc uses when it cannot resolve one.
+GENERIC_SIGNATURES = frozenset({None, '', '()', '(*args, **kwargs)'})
+
+#: Objects of these autodoc types can have their signature replaced.
+SIGNATURE_TYPES = frozenset({'function', 'method', 'decorator'})
+
+logger = logging.getLogger(__name__)
+
+
+def unwrap(fun):
+    """Return the innermost function of a ``__wrapped__`` chain."""
+    try:
+        return inspect.unwrap(fun)
+    except Exception:
+        # cycles, or proxies that cannot be evaluated.
+        return fun
+
+
+def is_task(obj):
+    try:
+        return callable(obj.run) and hasattr(obj, '__wrapped__')
+    except Exception:
+        return False
+
+
+class SignatureCache:
+    """Signatures of unwrapped objects keyed by object identity.
+
+    A reference to every object is kept, so that identities
+    are not reused while the cache is alive.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.bound_methods = {}
+        self.signatures = {}
+
+    def before_process_signature(self, app, obj, bound_method):
+        self.bound_methods[id(obj)] = (obj, bound_method)
+
+    def process_signature(self, app, what, name, obj, options,
+                          sig, return_annotation):
+        _, bound_method = self.bound_methods.pop(
+            id(obj), (None, what == 'method'))
+        if what not in SIGNATURE_TYPES:
+            return None
+        if sig not in GENERIC_SIGNATURES and not is_task(obj):
+            return None
+        return self.resolve(obj, bound_method)
+
+    def resolve(self, obj, bound_method):
+        key = id(obj)
+        cached = self.signatures.get(key)
+        if cached is not None and cached[0] is obj:
+            return cached[1]
+        resolved = None
+        fun = unwrap(obj)
+        if fun is not obj:
+            if is_task(obj):
+                # the task function of bound tasks takes the task first.
+                bound_method = inspect.ismethod(obj.run)
+            try:
+                resolved = self.format(fun, bound_method)
+            except (TypeError, ValueError) as exc:
+                logger.debug('autodocargspec: no signature for %r: %s',
+                             obj, exc)
+        self.signatures[key] = (obj, resolved)
+        return resolved
+
+    def format(self, fun, bound_method):
+        sig = signature(
+            fun, bound_method=bound_method,
+            type_aliases=self.config.autodoc_type_aliases,
+        )
+        show_annotation = self.config.autodoc_typehints in (
+            'signature', 'both')
+        return_annotation = None
+        if show_annotation and (
+                sig.return_annotation is not sig.empty):
+            return_annotation = stringify_annotation(sig.return_annotation)
+        return (
+            stringify_signature(
+                sig,
+                show_annotation=show_annotation,
+                show_return_annotation=False,
+            ),
+            return_annotation,
+        )
+
+
+def init_cache(app):
+    cache = app.autodocargspec_cache = SignatureCache(app.config)
+    app.connect('autodoc-before-process-signature',
+                cache.before_process_signature)
+    app.connect('autodoc-process-signature', cache.process_signature)
 
 
 def setup(app):
     app.require_sphinx('1.0')
+    app.setup_extension('sphinx.ext.autodoc')
+    app.connect('builder-inited', init_cache)
 
     return {
         'parallel_read_safe': True
@@ -3,19 +3,163 @@ import pickle
 import re
 
 from sphinx.builders import Builder
+from sphinx.util import logging
+
+from .reports import REPORT_WRITERS
 
 ERR_INVALID_REGEX = 'Invalid regex {0!r} in apicheck_ignore_modules: {1!r}'
 
+#: Patterns matching this are looked up by name instead of as regexes.
+RE_LITERAL = re.compile(r'^[\w.]+$')
+
+#: Patterns with backreferences cannot be merged with other patterns.
+RE_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+logger = logging.getLogger(__name__)
+
+
+class IgnoreMatcher:
+    """Match names against a list of ignore patterns.
+
+    Patterns that are plain names (e.g. ``django.utils.functional``)
+    are kept in a set, and plain names followed by ``.*``
+    (e.g. ``django.db.*``) in a prefix trie.  The remaining patterns
+    are merged into a single regular expression.
+
+    An optional callback can be used to ignore names programmatically,
+    and all verdicts are memoized.
+
+    :meth:`match` returns the pattern that matched, or :const:`None`.
+    """
+
+    #: Pattern reported when a name was ignored by the callback.
+    callback_pattern = '<callback>'
+
+    def __init__(self, patterns=(), callback=None, callback_name=None):
+        self.literals = {}
+        self.prefixes = {}
+        self.callback = callback
+        if callback_name:
+            self.callback_pattern = callback_name
+        self.cache = {}
+        regexes = []
+        for pattern, regex in patterns:
+            name = pattern.lstrip('^').rstrip('$')
+            if RE_LITERAL.match(name):
+                self.literals.setdefault(name, pattern)
+            elif name.endswith('.*') and RE_LITERAL.match(name[:-2]):
+                self._add_prefix(name[:-2], pattern)
+            else:
+                regexes.append((pattern, regex))
+        self.regexes = [
+            (pattern, regex) for pattern, regex in regexes
+            if RE_BACKREFERENCE.search(pattern)
+        ]
+        self.regex, self.regex_groups = self._merge_regexes([
+            (pattern, regex) for pattern, regex in regexes
+            if not RE_BACKREFERENCE.search(pattern)
+        ])
+
+    def _add_prefix(self, prefix, pattern):
+        node = self.prefixes
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node.setdefault('', pattern)
+
+    def _merge_regexes(self, regexes):
+        if not regexes:
+            return None, {}
+        try:
+            regex = re.compile('|'.join(
+                f'(?P<_{i}>{regex.pattern})'
+                for i, (_, regex) in enumerate(regexes)
+            ))
+        except re.error:
+            # e.g. duplicate group names, match them one by one.
+            self.regexes.extend(regexes)
+            return None, {}
+        return regex, {
+            f'_{i}': pattern for i, (pattern, _) in enumerate(regexes)
+        }
+
+    def __call__(self, name):
+        return self.match(name) is not None
+
+    def match(self, name):
+        try:
+            return self.cache[name]
+        except KeyError:
+            pattern = self.cache[name] = self._match(name)
+            if pattern is not None:
+                logger.debug('[ignore] %s ignored by %r', name, pattern)
+            return pattern
+
+    def _match(self, name):
+        pattern = self.literals.get(name)
+        if pattern is not None:
+            return pattern
+        pattern = self._match_prefix(name)
+        if pattern is not None:
+            return pattern
+        pattern = self._match_regex(name)
+        if pattern is not None:
+            return pattern
+        if self.callback is not None and self.callback(name):
+            return self.callback_pattern
+
+    def _match_prefix(self, name):
+        node = self.prefixes
+        for char in name:
+            node = node.get(char)
+            if node is None:
+                return
+            if '' in node:
+                return node['']
+
+    def _match_regex(self, name):
+        if self.regex is not None:
+            match = self.regex.match(name)
+            if match is not None:
+                return self.regex_groups[match.lastgroup]
+        for pattern, regex in self.regexes:
+            if regex.match(name):
+                return pattern
+
 
 class BaseBuilder(Builder):
 
+    #: Report formats written, ``pickle`` and the formats
+    #: in :data:`~sphinx_celery.reports.REPORT_WRITERS`.
+    report_formats = ['pickle']
+
+    _report_writers = None
+
     def get_outdated_docs(self):
         return f'{self.name} overview'
 
     def finish(self):
-        picklepath = os.path.join(self.outdir, self.pickle_filename)
-        with open(picklepath, mode='wb') as fh:
-            pickle.dump(self.as_dict(), fh)
+        if 'pickle' in self.report_formats:
+            picklepath = os.path.join(self.outdir, self.pickle_filename)
+            with open(picklepath, mode='wb') as fh:
+                pickle.dump(self.as_dict(), fh)
+        for writer in self.report_writers:
+            writer.close()
+        self._report_writers = None
+
+    @property
+    def report_writers(self):
+        # opened on first use, as outdir may change after init.
+        if self._report_writers is None:
+            self._report_writers = [
+                REPORT_WRITERS[report_format](self.outdir, self.name)
+                for report_format in self.report_formats
+                if report_format != 'pickle'
+            ]
+        return self._report_writers
+
+    def report(self, check, domain, failures, duration):
+        for writer in self.report_writers:
+            writer.write_check(check, domain, failures, duration)
 
     def compile_regex(self, regex):
         if not regex.startswith('^'):
@@ -25,7 +169,40 @@ class BaseBuilder(Builder):
         try:
             return re.compile(regex)
         except Exception as exc:
-            self.warn(ERR_INVALID_REGEX.format(regex, exc))
+            logger.warning(ERR_INVALID_REGEX.format(regex, exc))
 
     def compile_regexes(self, regexes):
         return [self.compile_regex(regex) for regex in regexes]
+
+    def compile_matcher(self, patterns, callback=None, callback_name=None):
+        compiled = zip(patterns, self.compile_regexes(patterns))
+        return IgnoreMatcher(
+            [(pattern, regex) for pattern, regex in compiled if regex],
+            callback=callback,
+            callback_name=callback_name,
+        )
+
+
+def get_report_dir(app, name):
+    # Reports of checks run as part of another build are written
+    # to a subdirectory of the output directory.
+    if app.builder.name == name:
+        return str(app.outdir)
+    return os.path.join(app.outdir, name)
+
+
+def run_check_on_build(app, name):
+    builder = create_builder(app, name)
+    builder.outdir = get_report_dir(app, name)
+    os.makedirs(builder.outdir, exist_ok=True)
+    builder.write()
+    builder.finish()
+
+
+def create_builder(app, name):
+    # Create and initialize another builder sharing the environment of app.
+    builder = app.create_builder(name)
+    if getattr(builder, 'env', None) is None:
+        builder.set_environment(app.env)
+    builder.init()
+    return builder
@@ -0,0 +1,249 @@
+"""
+
+Sphinx Celery Reference Pre-scan
+================================
+
+Runs the :mod:`~sphinx_celery.apicheck` and
+:mod:`~sphinx_celery.configcheck` builders without reading the
+documentation with Sphinx.
+
+Instead of parsing every document the reStructuredText sources
+are scanned for ``automodule``, ``module`` and ``setting`` directives,
+which makes it fast enough to be run as a pre-commit hook.
+As the members of modules are not scanned, object coverage
+(``apicheck_static``) is disabled unless enabled with ``-D``.
+
+The configuration of the builders (``apicheck_ignore_modules``,
+``configcheck_project_settings``, etc.) is read from ``conf.py`` as usual.
+
+Usage
+-----
+
+.. code-block:: console
+
+    $ python -m sphinx_celery.check docs/
+
+To only run one of the checks:
+
+.. code-block:: console
+
+    $ python -m sphinx_celery.check -b configcheck docs/
+
+To only check the modules and settings changed on a branch:
+
+.. code-block:: console
+
+    $ python -m sphinx_celery.check -r main...HEAD docs/
+
+Example ``.pre-commit-config.yaml``:
+
+.. code-block:: yaml
+
+    - repo: local
+      hooks:
+        - id: apicheck
+          name: apicheck
+          entry: python -m sphinx_celery.check docs/
+          language: system
+          pass_filenames: false
+
+"""
+
+import argparse
+import os
+import re
+import sys
+
+from .builders import create_builder
+from .importcosts import SKIP_ENVVAR
+
+CHECK_BUILDERS = ['apicheck', 'configcheck']
+
+DEFAULT_OUTDIR = os.path.join('_build', 'check')
+
+RE_DIRECTIVE = re.compile(
+    r'^[ \t]*\.\.[ \t]+(?P<directive>automodule|(?:py:)?module|setting)'
+    r'::[ \t]*(?P<target>\S+)',
+    re.MULTILINE,
+)
+
+
+def find_sources(srcdir, config):
+    from sphinx.util.matching import Matcher
+    suffixes = config.source_suffix
+    if isinstance(suffixes, str):
+        suffixes = [suffixes]
+    suffixes = tuple(suffix for suffix in suffixes if suffix.endswith('rst'))
+    excluded = Matcher(
+        list(config.exclude_patterns) + list(config.templates_path))
+    for dirpath, dirnames, filenames in os.walk(srcdir):
+        reldir = os.path.relpath(dirpath, srcdir)
+        dirnames[:] = [
+            dirname for dirname in dirnames
+            if not dirname.startswith('.') and
+            not excluded(os.path.normpath(os.path.join(reldir, dirname)))
+        ]
+        for filename in filenames:
+            if not filename.endswith(suffixes):
+                continue
+            relpath = os.path.normpath(os.path.join(reldir, filename))
+            if excluded(relpath):
+                continue
+            docname = os.path.splitext(relpath)[0].replace(os.sep, '/')
+            yield docname, os.path.join(dirpath, filename)
+
+
+def scan_document(path):
+    with open(path, encoding='utf-8') as fh:
+        text = fh.read()
+    if '::' not in text:
+        return
+    for match in RE_DIRECTIVE.finditer(text):
+        yield match.group('directive'), match.group('target')
+
+
+def prescan(env, sources):
+    for docname, path in sources:
+        prescan_document(env, docname, path)
+
+
+def prescan_document(env, docname, path):
+    # Register the scanned targets the same way reading them would.
+    modules = env.domaindata['py']['modules']
+    objects = env.domaindata['std']['objects']
+    for directive, target in scan_document(path):
+        if directive == 'setting':
+            objects['setting', target] = (docname, f'setting-{target}')
+        else:
+            modules[target] = (docname, f'module-{target}', '', '', False)
+
+
+def purge_document(env, docname):
+    # Remove the targets registered by prescan_document.
+    for data, kind in ((env.domaindata['py']['modules'], None),
+                       (env.domaindata['std']['objects'], 'setting')):
+        for key, entry in list(data.items()):
+            if entry[0] == docname and (kind is None or key[0] == kind):
+                del data[key]
+
+
+def clear_intersphinx_mapping(app, config):
+    # No need to fetch inventories when nothing is being resolved.
+    config.intersphinx_mapping = {}
+
+
+def disable_static_coverage(app, config):
+    # Only modules are registered by the pre-scan, not their members,
+    # so all objects would be reported as undocumented.
+    config.apicheck_static = False
+
+
+#: Config values overridden when the extension defining them is loaded,
+#: unless they're overridden by the caller.
+EXTENSION_OVERRIDES = {
+    'sphinx.ext.intersphinx': (
+        'intersphinx_mapping', clear_intersphinx_mapping),
+    'sphinx_celery.apicheck': ('apicheck_static', disable_static_coverage),
+}
+
+
+def create_app(srcdir, outdir, confdir=None, doctreedir=None,
+               buildername=CHECK_BUILDERS[0], confoverrides=None,
+               freshenv=True):
+    from sphinx.application import Sphinx
+    confoverrides = dict(confoverrides or {})
+
+    class CheckApp(Sphinx):
+
+        def setup_extension(self, extname):
+            # Overriding these in confoverrides would warn about an
+            # unknown config value if the extension is not enabled.
+            name, handler = EXTENSION_OVERRIDES.get(extname, (None, None))
+            override = (name is not None and
+                        extname not in self.extensions and
+                        name not in confoverrides)
+            super().setup_extension(extname)
+            if override:
+                self.connect('config-inited', handler)
+
+    # nothing is imported, so modules need not be mocked.
+    skip_import_costs = os.environ.get(SKIP_ENVVAR)
+    os.environ[SKIP_ENVVAR] = '1'
+    try:
+        return CheckApp(
+            srcdir, confdir or srcdir, outdir,
+            doctreedir or os.path.join(outdir, '.doctrees'),
+            buildername,
+            confoverrides=confoverrides,
+            status=None,
+            warning=sys.stderr,
+            freshenv=freshenv,
+        )
+    finally:
+        if skip_import_costs is None:
+            del os.environ[SKIP_ENVVAR]
+
+
+def run(app, builders=CHECK_BUILDERS):
+    prescan(app.env, find_sources(app.srcdir, app.config))
+    for name in builders:
+        builder = (app.builder if app.builder.name == name
+                   else create_builder(app, name))
+        builder.write()
+        builder.finish()
+    return app.statuscode
+
+
+def parse_define(value):
+    try:
+        name, value = value.split('=', 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f'-D option argument must be in the form name=value: {value!r}')
+    return name, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m sphinx_celery.check',
+        description='Check API and configuration reference coverage '
+                    'without building the documentation.',
+    )
+    parser.add_argument('sourcedir')
+    parser.add_argument(
+        'outdir', nargs='?',
+        help=f'report directory (default: SOURCEDIR/{DEFAULT_OUTDIR})')
+    parser.add_argument(
+        '-b', dest='builders', action='append', choices=CHECK_BUILDERS,
+        help='check to run (default: all)')
+    parser.add_argument(
+        '-c', dest='confdir', help='directory containing conf.py')
+    parser.add_argument(
+        '-d', dest='doctreedir', help='directory for cached data')
+    parser.add_argument(
+        '-D', dest='define', action='append', default=[], type=parse_define,
+        metavar='setting=value', help='override a setting in conf.py')
+    parser.add_argument(
+        '-r', '--git-range', dest='git_range', metavar='REVRANGE',
+        help='only check what changed in this git revision range')
+    args = parser.parse_args(argv)
+
+    builders = args.builders or CHECK_BUILDERS
+    if args.git_range:
+        args.define.extend([
+            ('apicheck_git_range', args.git_range),
+            ('configcheck_git_range', args.git_range),
+        ])
+    app = create_app(
+        args.sourcedir,
+        args.outdir or os.path.join(args.sourcedir, DEFAULT_OUTDIR),
+        confdir=args.confdir,
+        doctreedir=args.doctreedir,
+        buildername=builders[0],
+        confoverrides=dict(args.define),
+    )
+    return run(app, builders)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+
+Precompressed HTML Output
+=========================
+
+Writes ``.gz`` (and ``.br`` if the ``brotli`` module is installed)
+copies of the files of HTML builds when the build is finished, for
+static servers that serve precompressed files (e.g. ``gzip_static``
+in nginx).
+
+Only files whose content changed since the last build are compressed
+again, which is tracked by a manifest of content hashes in the doctree
+directory.  Files are hashed and compressed by a pool of processes.
+
+Enabled by passing ``compress_output=True`` to
+:func:`sphinx_celery.conf.build_config`.
+
+Configuration
+-------------
+
+compress_formats
+~~~~~~~~~~~~~~~~
+
+Formats to write, formats that are not available are skipped.
+
+Default is ``['gzip', 'brotli']``.
+
+compress_suffixes
+~~~~~~~~~~~~~~~~~
+
+Suffixes of the files to compress.
+
+Default is ``['.html', '.js', '.css', '.svg', '.txt', '.json', '.xml']``.
+
+compress_min_size
+~~~~~~~~~~~~~~~~~
+
+Files smaller than this (in bytes) are not compressed.
+
+Default is ``1024``.
+
+compress_workers
+~~~~~~~~~~~~~~~~
+
+Number of processes, or :const:`None` for one per CPU.
+
+Default is :const:`None`.
+
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from sphinx.util import logging
+
+from .utils import atomic_write
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+__all__ = ['compress_file', 'compress_tree']
+
+MANIFEST_FILENAME = 'compress_manifest.json'
+
+DEFAULT_FORMATS = ['gzip', 'brotli']
+DEFAULT_SUFFIXES = ['.html', '.js', '.css', '.svg', '.txt', '.json', '.xml']
+DEFAULT_MIN_SIZE = 1024
+
+EXTENSIONS = {'gzip': '.gz', 'brotli': '.br'}
+
+INFO_COMPRESSED = 'compress: Compressed {0} of {1} files ({2})'
+
+logger = logging.getLogger(__name__)
+
+
+def available_formats(formats):
+    return [
+        fmt for fmt in formats
+        if fmt in EXTENSIONS and (fmt != 'brotli' or brotli is not None)
+    ]
+
+
+def compress_data(data, fmt):
+    if fmt == 'gzip':
+        # mtime=0 so unchanged files are compressed to the same bytes.
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+def remove_compressed(path, formats=EXTENSIONS):
+    for fmt in formats:
+        try:
+            os.unlink(path + EXTENSIONS[fmt])
+        except FileNotFoundError:
+            pass
+
+
+def compress_file(path, digest=None, formats=DEFAULT_FORMATS,
+                  min_size=DEFAULT_MIN_SIZE):
+    """Write compressed copies of *path* next to it.
+
+    Nothing is written if the content still has the hash *digest*
+    and the compressed copies exist.  Returns the hash of the content,
+    or :const:`None` if the file is smaller than *min_size*.
+    """
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    if len(data) < min_size:
+        remove_compressed(path)
+        return None
+    new_digest = hashlib.sha1(data).hexdigest()
+    if new_digest == digest and all(
+            os.path.exists(path + EXTENSIONS[fmt]) for fmt in formats):
+        return new_digest
+    for fmt in formats:
+        with atomic_write(path + EXTENSIONS[fmt], 'wb') as fh:
+            fh.write(compress_data(data, fmt))
+    return new_digest
+
+
+def _compress(args):
+    return compress_file(*args)
+
+
+def find_files(outdir, suffixes, exclude=()):
+    suffixes = tuple(suffixes)
+    exclude = {os.path.abspath(path) for path in exclude}
+    for dirpath, dirnames, filenames in os.walk(outdir):
+        # skips .doctrees and other hidden directories.
+        dirnames[:] = sorted(
+            name for name in dirnames
+            if not name.startswith('.') and
+            os.path.abspath(os.path.join(dirpath, name)) not in exclude)
+        for filename in sorted(filenames):
+            if filename.endswith(suffixes) and os.path.abspath(
+                    os.path.join(dirpath, filename)) not in exclude:
+                yield os.path.relpath(
+                    os.path.join(dirpath, filename), outdir)
+
+
+def compress_tree(outdir, manifest, formats=DEFAULT_FORMATS,
+                  suffixes=DEFAULT_SUFFIXES, min_size=DEFAULT_MIN_SIZE,
+                  workers=None, exclude=()):
+    """Compress the files in *outdir* that changed since *manifest*.
+
+    *manifest* maps paths relative to *outdir* to content hashes.
+    Files and directories in *exclude* are skipped.
+    Returns the new manifest and the number of files compressed.
+    """
+    paths = list(find_files(outdir, suffixes, exclude))
+    jobs = [
+        (os.path.join(outdir, path), manifest.get(path), formats, min_size)
+        for path in paths
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        digests = list(pool.map(_compress, jobs, chunksize=32))
+    result = {
+        path: digest for path, digest in zip(paths, digests)
+        if digest is not None
+    }
+    # files removed since the last build.
+    for path in set(manifest) - set(paths):
+        remove_compressed(os.path.join(outdir, path))
+    changed = sum(
+        1 for path, digest in result.items() if manifest.get(path) != digest)
+    return result, changed
+
+
+def load_manifest(path, formats):
+    try:
+        with open(path) as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('formats') != formats:
+        return {}
+    return manifest.get('files', {})
+
+
+def compress_output(app, exception):
+    if exception is not None or app.builder.format != 'html':
+        return
+    config = app.config
+    formats = available_formats(config.compress_formats)
+    if not formats:
+        return
+    manifest_path = os.path.join(app.doctreedir, MANIFEST_FILENAME)
+    manifest, changed = compress_tree(
+        str(app.outdir),
+        load_manifest(manifest_path, formats),
+        formats=formats,
+        suffixes=config.compress_suffixes,
+        min_size=config.compress_min_size,
+        workers=(int(config.compress_workers)
+                 if config.compress_workers else None),
+        # the doctree directory may be inside the output directory.
+        exclude=[str(app.doctreedir), manifest_path],
+    )
+    os.makedirs(app.doctreedir, exist_ok=True)
+    with open(manifest_path, 'w') as fh:
+        json.dump({'formats': formats, 'files': manifest}, fh,
+                  indent=1, sort_keys=True)
+    logger.info(INFO_COMPRESSED.format(
+        changed, len(manifest), ', '.join(formats)))
+
+
+def setup(app):
+    app.add_config_value('compress_formats', DEFAULT_FORMATS, '')
+    app.add_config_value('compress_suffixes', DEFAULT_SUFFIXES, '')
+    app.add_config_value('compress_min_size', DEFAULT_MIN_SIZE, '')
+    app.add_config_value('compress_workers', None, '')
+    # after other extensions writing output files.
+    app.connect('build-finished', compress_output, priority=900)
+
+    return {
+        'parallel_read_safe': True,
+    }
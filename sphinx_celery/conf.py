@@ -2,6 +2,10 @@ import os
 import sys
 
 from . import get_html_templates_path
+from .compress import DEFAULT_MIN_SIZE
+from .importcosts import DEFAULT_THRESHOLD, SKIP_ENVVAR, expensive_imports
+from .intersphinx_usage import USAGE_FILENAME, used_projects
+from .inventories import DEFAULT_TTL
 
 LINKCODE_URL = 'https://github.com/{proj}/tree/{branch}/{filename}.py'
 GITHUB_BRANCH = 'master'
@@ -22,6 +26,7 @@ EXTENSIONS = [
     'sphinx_celery.setting_crossref',
     'sphinx_celery.apicheck',
     'sphinx_celery.configcheck',
+    'sphinx_celery.shacheck',
 ]
 
 INTERSPHINX_MAPPING = {
@@ -84,7 +89,7 @@ def import_package(package):
 
 
 def prepare_intersphinx_mapping(project, mapping,
-                                include, exclude, **extra):
+                                include, exclude, *, used=None, **extra):
     if include:
         mapping = {k: v for k, v in mapping.items() if k in include}
     if exclude:
@@ -94,6 +99,10 @@ def prepare_intersphinx_mapping(project, mapping,
     # Remove project itself from intersphinx
     mapping.pop(project.lower(), None)
 
+    # Only keep projects that references resolved to in earlier builds.
+    if used is not None:
+        mapping = {k: v for k, v in mapping.items() if k in used}
+
     return mapping
 
 
@@ -143,11 +152,46 @@ def build_config(
         spelling_lang='en_US',
         spelling_show_suggestions=True,
         extlinks=None,
+        mock_expensive_imports=False,
+        mock_imports_threshold=DEFAULT_THRESHOLD,
+        mock_imports_exclude=(),
+        import_costs_cache=None,
+        defer_django=False,
+        intersphinx_cache=False,
+        intersphinx_cache_ttl=DEFAULT_TTL,
+        intersphinx_prefetch=True,
+        prune_intersphinx=False,
+        compress_output=False,
+        compress_min_size=DEFAULT_MIN_SIZE,
+        math_cache=False,
+        source_pages='viewcode',
         **kwargs):
     add_paths(config_file, path_additions)
-    if configure_django_settings or django_settings:
+    if defer_django and (configure_django_settings or django_settings):
+        # configured by sphinx_celery.lazydjango when first needed.
+        extra_extensions = list(extra_extensions) + [
+            'sphinx_celery.lazydjango']
+        kwargs.setdefault('lazydjango_settings', django_settings)
+        kwargs.setdefault(
+            'lazydjango_configure', configure_django_settings or None)
+    elif configure_django_settings or django_settings:
         configure_django(django_settings, **configure_django_settings or {})
     package = import_package(package)
+    if mock_expensive_imports and not os.environ.get(SKIP_ENVVAR):
+        # Third-party modules that are missing or slow to import
+        # are mocked, see sphinx_celery.importcosts.
+        kwargs['autodoc_mock_imports'] = sorted(
+            set(kwargs.get('autodoc_mock_imports', ())) | set(
+                expensive_imports(
+                    package,
+                    import_costs_cache or os.path.join(
+                        os.path.dirname(os.path.abspath(config_file)),
+                        '_build', 'importcosts.json'),
+                    threshold=mock_imports_threshold,
+                    # imported later when deferred, but must not be mocked.
+                    exclude=list(mock_imports_exclude) + (
+                        ['django'] if defer_django else []),
+                )))
     description = description or package.__doc__
     author = author or package.__author__
     author_name = author_name or author
@@ -171,6 +215,38 @@ def build_config(
         'https://en.wikipedia.org/wiki/%s', None,
     ))
 
+    used_intersphinx = None
+    if prune_intersphinx:
+        # see sphinx_celery.intersphinx_usage
+        extra_extensions = list(extra_extensions) + [
+            'sphinx_celery.intersphinx_usage']
+        kwargs.setdefault('intersphinx_usage_file', os.path.join(
+            os.path.dirname(os.path.abspath(config_file)),
+            '_build', USAGE_FILENAME))
+        used_intersphinx = used_projects(kwargs['intersphinx_usage_file'])
+
+    if compress_output:
+        # see sphinx_celery.compress
+        extra_extensions = list(extra_extensions) + [
+            'sphinx_celery.compress']
+        kwargs.setdefault('compress_min_size', compress_min_size)
+
+    if math_cache:
+        # see sphinx_celery.mathcache
+        extra_extensions = list(extra_extensions) + [
+            'sphinx_celery.mathcache']
+        if isinstance(math_cache, str):
+            kwargs.setdefault('mathcache_dir', math_cache)
+
+    if intersphinx_cache:
+        # see sphinx_celery.inventories
+        extra_extensions = list(extra_extensions) + [
+            'sphinx_celery.inventories']
+        if isinstance(intersphinx_cache, str):
+            kwargs.setdefault('inventories_cache_dir', intersphinx_cache)
+        kwargs.setdefault('inventories_cache_ttl', intersphinx_cache_ttl)
+        kwargs.setdefault('inventories_prefetch', intersphinx_prefetch)
+
     if not canonical_dev_url:
         canonical_dev_url = '/'.join([
             canonical_url.rstrip('/'), 'en', 'main',
@@ -187,6 +263,16 @@ def build_config(
 
     version = '.'.join(map(str, package.VERSION[0:2]))
 
+    if source_pages == 'incremental':
+        # see sphinx_celery.viewcode_cache
+        extra_extensions = list(extra_extensions) + [
+            'sphinx_celery.viewcode_cache']
+    elif source_pages == 'linkcode':
+        # link to the source on GitHub instead of highlighted pages.
+        extensions = [
+            ext for ext in extensions if ext != 'sphinx.ext.viewcode'
+        ] + ['sphinx.ext.linkcode']
+
     extensions = extensions + extra_extensions
     if os.environ.get('SPELLCHECK'):
         extensions.append('sphinxcontrib.spelling')
@@ -231,6 +317,7 @@ def build_config(
             intersphinx_mapping,
             include_intersphinx,
             exclude_intersphinx,
+            used=used_intersphinx,
             **extra_intersphinx_mapping
         ),
 
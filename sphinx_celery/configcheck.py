@@ -61,35 +61,82 @@ Example:
         from django import conf
         return conf.is_deprecated(setting)
 
+configcheck_on_build
+~~~~~~~~~~~~~~~~~~~~
+
+Also run the check at the end of every other build (e.g. ``html``),
+instead of running ``sphinx-build -b configcheck`` separately.
+
+The report is written to the ``configcheck`` subdirectory of the output
+directory, and the exit status of ``sphinx-build`` is set if the check fails.
+
+Default is :const:`False`.
+
+configcheck_report_formats
+~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+List of report formats to write to the output directory,
+any of ``pickle``, ``jsonl`` (JSON Lines) and ``junit`` (JUnit XML).
+
+Default is ``['pickle']``.
+
+configcheck_git_range
+~~~~~~~~~~~~~~~~~~~~~
+
+Only check settings that may have changed in this git revision range.
+
+A setting is considered changed if its name, or the last parts of it
+(e.g. ``url`` or ``broker_url`` for ``broker_url``), appears on
+a line changed according to :command:`git diff`
+in the repository of the documentation.
+
+Default is :const:`None` (check all settings).
 
 """
 
+import subprocess
+import time
+
+from sphinx.util import logging
 from sphinx.util.console import bold, green, red
 
-from .builders import BaseBuilder
+from .builders import BaseBuilder, run_check_on_build
+from .git import changed_identifiers
 from .utils import bytes_if_py2
 
 ERR = 'ERROR'
 ERR_MISSING_DOC = '{error}: Setting not documented: {name}'
 OK_STATUS = 'OK: All settings documented :o)'
 
+ERR_GIT_RANGE = 'configcheck: Cannot read changes in {0!r}, checking all: {1}'
+
+logger = logging.getLogger(__name__)
+
+
+def is_changed_setting(setting, identifiers):
+    parts = setting.lower().split('_')
+    return any(
+        '_'.join(parts[i:]) in identifiers for i in range(len(parts))
+    )
+
 
 class ConfigCheckBuilder(BaseBuilder):
     name = 'configcheck'
     pickle_filename = 'configcheck.pickle'
 
     def init(self):
-        self.ignore_patterns = self.compile_regexes(
+        self.ignore_matcher = self.compile_matcher(
             self.config.configcheck_ignore_settings,
+            callback=self.config.configcheck_should_ignore,
+            callback_name='configcheck_should_ignore',
         )
-        self.should_ignore = (
-            self.config.configcheck_should_ignore or (lambda s: False))
+        self.report_formats = self.config.configcheck_report_formats
         self.project_settings = self.config.configcheck_project_settings
+        self.git_range = self.config.configcheck_git_range
         self.undocumented = set()
 
     def is_ignored_setting(self, setting):
-        return self.should_ignore(setting) or any(
-            regex.match(setting) for regex in self.ignore_patterns)
+        return self.ignore_matcher(setting)
 
     def write(self, *ignored):
         self.check_missing()
@@ -102,14 +149,35 @@ class ConfigCheckBuilder(BaseBuilder):
             if reftype == 'setting'
         }
 
-    def check_missing(self):
-        all_settings = self.project_settings()
-        documented_settings = self.documented_settings()
-        self.undocumented.update(
+    def find_undocumented(self, all_settings, documented_settings,
+                          identifiers=None):
+        return (
             setting for setting in all_settings ^ documented_settings
-            if not self.is_ignored_setting(setting)
+            if not self.is_ignored_setting(setting) and (
+                identifiers is None or
+                is_changed_setting(setting, identifiers))
         )
 
+    def find_changed_identifiers(self, revrange):
+        try:
+            return {
+                identifier.lower() for identifier in
+                changed_identifiers(revrange, str(self.srcdir))
+            }
+        except (OSError, subprocess.CalledProcessError) as exc:
+            logger.warning(ERR_GIT_RANGE.format(
+                revrange, getattr(exc, 'stderr', None) or exc))
+
+    def check_missing(self):
+        start = time.monotonic()
+        self.undocumented.update(self.find_undocumented(
+            self.project_settings(), self.documented_settings(),
+            identifiers=(self.find_changed_identifiers(self.git_range)
+                         if self.git_range else None),
+        ))
+        self.report('undocumented', 'std', sorted(self.undocumented),
+                    time.monotonic() - start)
+
         for setting in self.undocumented:
             self.app.statuscode = 2
             print(ERR_MISSING_DOC.format(
@@ -125,6 +193,12 @@ class ConfigCheckBuilder(BaseBuilder):
         }
 
 
+def check_on_build(app, exception):
+    if (exception is None and app.config.configcheck_on_build and
+            app.builder.name != ConfigCheckBuilder.name):
+        run_check_on_build(app, ConfigCheckBuilder.name)
+
+
 def setup(app):
     app.add_builder(ConfigCheckBuilder)
     app.add_config_value(
@@ -133,6 +207,13 @@ def setup(app):
         bytes_if_py2('configcheck_project_settings'), None, False)
     app.add_config_value(
         bytes_if_py2('configcheck_should_ignore'), None, False)
+    app.add_config_value(
+        bytes_if_py2('configcheck_on_build'), False, False)
+    app.add_config_value(
+        bytes_if_py2('configcheck_report_formats'), ['pickle'], False)
+    app.add_config_value(
+        bytes_if_py2('configcheck_git_range'), None, False)
+    app.connect('build-finished', check_on_build)
 
     return {
         'parallel_read_safe': True
@@ -0,0 +1,178 @@
+"""
+
+Theme Stylesheet Bundle
+=======================
+
+Renders the theme stylesheet with the stylesheets it imports
+(``@import url("basic.css")``) inlined, minifies it, and writes it as
+``_static/celery.<hash>.css``, so pages load a single stylesheet that
+can be cached by browsers forever.
+
+Pages link the bundle instead of ``_static/celery.css``.  The bundle is
+only rendered again when the theme options or one of the stylesheet
+templates change.
+
+Theme Options
+-------------
+
+bundle_css
+~~~~~~~~~~
+
+Set to ``false`` in ``html_theme_options`` to link the stylesheets
+separately.
+
+Default is ``true``.
+
+"""
+
+import hashlib
+import json
+import os
+import re
+
+from sphinx.util import logging
+
+__all__ = ['minify_css']
+
+STYLESHEET = 'celery.css'
+STATE_FILENAME = 'css_bundle.json'
+BUNDLE_FORMAT = 'celery.{digest}.css'
+
+TEMPLATE_SUFFIXES = ('', '_t', '.jinja')
+
+RE_IMPORT = re.compile(
+    r'''@import\s+url\(\s*["']?(?P<name>[^"')]+?)["']?\s*\)\s*;''')
+RE_BUNDLE = re.compile(r'^celery\.[0-9a-f]+\.css$')
+RE_COMMENTS = re.compile(
+    r'''("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')|/\*.*?\*/''', re.S)
+RE_STRINGS = re.compile(r'''("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')''')
+RE_SPACE = re.compile(r'\s+')
+RE_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+RE_COLON = re.compile(r':\s+')
+
+INFO_BUNDLE = 'cssbundle: Wrote {0}'
+
+logger = logging.getLogger(__name__)
+
+
+def minify_css(css):
+    """Remove comments and insignificant whitespace from *css*."""
+    css = RE_COMMENTS.sub(lambda m: m.group(1) or '', css)
+    parts = RE_STRINGS.split(css)
+    for i in range(0, len(parts), 2):
+        part = RE_SPACE.sub(' ', parts[i])
+        part = RE_PUNCTUATION.sub(r'\1', part)
+        parts[i] = RE_COLON.sub(':', part)
+    return ''.join(parts).replace(';}', '}').strip()
+
+
+def is_enabled(value):
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def find_static(theme, name):
+    for themedir in theme.get_theme_dirs():
+        for suffix in TEMPLATE_SUFFIXES:
+            path = os.path.join(themedir, 'static', name + suffix)
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def read(path):
+    with open(path, encoding='utf-8') as fh:
+        return fh.read()
+
+
+def find_sources(theme, name, seen=None):
+    """Return paths of the stylesheet *name* and the files it imports."""
+    seen = set() if seen is None else seen
+    path = find_static(theme, name)
+    if path is None or path in seen:
+        return []
+    seen.add(path)
+    paths = [path]
+    for match in RE_IMPORT.finditer(read(path)):
+        paths.extend(find_sources(theme, match.group('name'), seen))
+    return paths
+
+
+def render(builder, name, context, seen=None):
+    seen = set() if seen is None else seen
+    path = find_static(builder.theme, name)
+    if path is None or path in seen:
+        return None
+    seen.add(path)
+    source = read(path)
+    if path.endswith(TEMPLATE_SUFFIXES[1:]):
+        source = builder.templates.render_string(source, context)
+    remote = []
+
+    def inline(match):
+        css = render(builder, match.group('name'), context, seen)
+        if css is None:
+            # @import is only allowed at the start of a stylesheet.
+            remote.append(match.group(0))
+            return ''
+        return css
+    css = RE_IMPORT.sub(inline, source)
+    return '\n'.join(remote + [css])
+
+
+def bundle_stylesheet(app):
+    builder = app.builder
+    theme = getattr(builder, 'theme', None)
+    if theme is None:
+        return
+    options = theme.get_options(builder.theme_options)
+    if not is_enabled(options.get('bundle_css')) or not find_static(
+            theme, STYLESHEET):
+        return
+    context = {f'theme_{key}': value for key, value in options.items()}
+    context.update(app.config.html_context)
+
+    digest = hashlib.sha1()
+    digest.update(json.dumps(
+        sorted(options.items()), default=repr).encode('utf-8'))
+    for path in find_sources(theme, STYLESHEET):
+        digest.update(read(path).encode('utf-8'))
+    digest = digest.hexdigest()
+
+    staticdir = os.path.join(builder.outdir, '_static')
+    state_path = os.path.join(app.doctreedir, STATE_FILENAME)
+    try:
+        with open(state_path) as fh:
+            state = json.load(fh)
+    except (OSError, ValueError):
+        state = {}
+    filename = state.get('filename')
+    if state.get('digest') != digest or not filename or not os.path.exists(
+            os.path.join(staticdir, filename)):
+        css = minify_css(render(builder, STYLESHEET, context)) + '\n'
+        filename = BUNDLE_FORMAT.format(digest=hashlib.sha1(
+            css.encode('utf-8')).hexdigest()[:16])
+        os.makedirs(staticdir, exist_ok=True)
+        for name in os.listdir(staticdir):
+            if RE_BUNDLE.match(name) and name != filename:
+                os.unlink(os.path.join(staticdir, name))
+        with open(os.path.join(staticdir, filename), 'w',
+                  encoding='utf-8') as fh:
+            fh.write(css)
+        os.makedirs(app.doctreedir, exist_ok=True)
+        with open(state_path, 'w') as fh:
+            json.dump({'digest': digest, 'filename': filename}, fh)
+        logger.info(INFO_BUNDLE.format(filename))
+    app.cssbundle_filename = filename
+    app.add_css_file(filename, priority=200)
+
+
+def replace_stylesheet(app, pagename, templatename, context, doctree):
+    if not getattr(app, 'cssbundle_filename', None):
+        return
+    unbundled = f'_static/{STYLESHEET}'
+    context['css_files'] = [
+        css for css in context.get('css_files', ())
+        if getattr(css, 'filename', css) != unbundled
+    ]
@@ -0,0 +1,71 @@
+"""Helpers for reading changes from a local git repository."""
+
+import os
+import re
+import subprocess
+
+__all__ = [
+    'changed_files', 'changed_identifiers', 'git', 'git_toplevel',
+    'module_for_path',
+]
+
+RE_IDENTIFIER = re.compile(r'\w+')
+
+
+def git(args, cwd=None, input=None):
+    return subprocess.run(
+        ['git'] + list(args),
+        cwd=cwd,
+        input=input,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    ).stdout
+
+
+def git_toplevel(path):
+    if not os.path.isdir(path):
+        path = os.path.dirname(path)
+    return git(['rev-parse', '--show-toplevel'], cwd=path).strip()
+
+
+def changed_files(revrange, cwd):
+    """Return absolute paths of files changed in a revision range.
+
+    *revrange* is anything accepted by :command:`git diff`,
+    e.g. ``main...HEAD`` or a single revision to compare the
+    working tree with.
+    """
+    toplevel = git_toplevel(cwd)
+    output = git(['diff', '--name-only', '-z', revrange], cwd=toplevel)
+    return [
+        os.path.join(toplevel, name) for name in output.split('\0') if name
+    ]
+
+
+def changed_identifiers(revrange, cwd):
+    """Return the set of identifiers on added or removed lines."""
+    toplevel = git_toplevel(cwd)
+    output = git(['diff', '-U0', '--no-color', revrange], cwd=toplevel)
+    return {
+        identifier
+        for line in output.splitlines()
+        if line[:1] in '+-' and not line.startswith(('+++', '---'))
+        for identifier in RE_IDENTIFIER.findall(line[1:])
+    }
+
+
+def module_for_path(path, name, package_path):
+    """Return the name of the module at *path* in package *name*.
+
+    *package_path* is the directory of the package, returns :const:`None`
+    if *path* is not a Python module of the package.
+    """
+    relpath = os.path.relpath(os.path.abspath(path), package_path)
+    if not relpath.endswith('.py') or relpath.startswith(os.pardir):
+        return None
+    parts = relpath[:-3].split(os.sep)
+    if parts[-1] == '__init__':
+        parts.pop()
+    return '.'.join([name] + parts)
@@ -0,0 +1,215 @@
+"""Cached issue metadata from the GitHub GraphQL API.
+
+Issues are fetched in batches, one query per batch of issues of the
+same project, from a bounded thread pool.  Results are kept in a JSON
+file, and only issues missing from it or older than the TTL are
+fetched again.  The ETag of every batch is stored too, and sent along
+so that the server can answer with ``304 Not Modified``.
+
+Nothing here depends on Sphinx, and the endpoint is configurable so
+that a local server can stand in for GitHub.
+"""
+
+import hashlib
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import atomic_write
+
+__all__ = ['GRAPHQL_URL', 'IssueCache', 'fetch_issues', 'issue_key']
+
+GRAPHQL_URL = 'https://api.github.com/graphql'
+
+USER_AGENT = 'sphinx_celery'
+
+ISSUE_FIELDS = '{ ... on Issue { title state } ' \
+               '... on PullRequest { title state } }'
+
+QUERY_FORMAT = 'query {{ repository(owner: {owner}, name: {name}) {{ ' \
+               '{fields} }} }}'
+
+FIELD_FORMAT = 'i{number}: issueOrPullRequest(number: {number}) {fields}'
+
+
+def issue_key(project, issue_id):
+    return f'{project}#{issue_id}'
+
+
+def parse_issue_key(key):
+    project, _, issue_id = key.rpartition('#')
+    return project, issue_id
+
+
+class IssueCache:
+    """Issue titles and states kept in a JSON file.
+
+    Entries are dicts with ``title``, ``state`` and the ``fetched``
+    timestamp, keyed by :func:`issue_key`.
+    """
+
+    def __init__(self, path=None, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self.issues = {}
+        self.etags = {}
+        self.changed = False
+        if path is not None:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return
+        self.issues = data.get('issues', {})
+        self.etags = data.get('etags', {})
+
+    def save(self):
+        if self.path is None or not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.path) or os.curdir, exist_ok=True)
+        with atomic_write(self.path) as fh:
+            json.dump({'issues': self.issues, 'etags': self.etags}, fh)
+        self.changed = False
+
+    def get(self, key):
+        return self.issues.get(key)
+
+    def is_stale(self, key, now=None):
+        entry = self.issues.get(key)
+        if entry is None:
+            return True
+        if self.ttl is None:
+            return False
+        now = time.time() if now is None else now
+        return now - entry['fetched'] > self.ttl
+
+    def stale(self, keys, now=None):
+        now = time.time() if now is None else now
+        return sorted(key for key in keys if self.is_stale(key, now))
+
+    def update(self, key, title, state, now):
+        # returns true if the title or state of the issue changed.
+        previous = self.issues.get(key)
+        self.issues[key] = {'title': title, 'state': state, 'fetched': now}
+        self.changed = True
+        return previous is None or (
+            (previous['title'], previous['state']) != (title, state))
+
+    def touch(self, key, now):
+        self.issues[key]['fetched'] = now
+        self.changed = True
+
+
+def batch_key(project, numbers):
+    ids = ','.join(map(str, numbers))
+    return hashlib.sha1(f'{project}:{ids}'.encode()).hexdigest()
+
+
+def make_query(project, numbers):
+    owner, _, name = project.partition('/')
+    return QUERY_FORMAT.format(
+        owner=json.dumps(owner),
+        name=json.dumps(name),
+        fields=' '.join(
+            FIELD_FORMAT.format(number=number, fields=ISSUE_FIELDS)
+            for number in numbers
+        ),
+    )
+
+
+def fetch_batch(url, project, numbers, token=None, etag=None, timeout=30):
+    """Fetch one batch of issues.
+
+    Returns an ``(etag, issues)`` tuple, where *issues* maps issue
+    numbers to ``(title, state)`` or :const:`None` if the issue does
+    not exist, or is :const:`None` if the server answered with
+    ``304 Not Modified``.
+    """
+    request = urllib.request.Request(
+        url,
+        data=json.dumps({'query': make_query(project, numbers)}).encode(),
+        headers={
+            'Content-Type': 'application/json',
+            'User-Agent': USER_AGENT,
+        },
+    )
+    if token:
+        request.add_header('Authorization', f'bearer {token}')
+    if etag:
+        request.add_header('If-None-Match', etag)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            etag = response.headers.get('ETag')
+            body = json.load(response)
+    except urllib.error.HTTPError as exc:
+        if exc.code == 304:
+            return etag, None
+        raise
+    repository = (body.get('data') or {}).get('repository')
+    if repository is None:
+        raise ValueError(f'{project}: {body.get("errors")!r}')
+    issues = {}
+    for number in numbers:
+        node = repository.get(f'i{number}')
+        issues[number] = None if node is None else (
+            node.get('title'), node.get('state'))
+    return etag, issues
+
+
+def fetch_issues(cache, keys, url=GRAPHQL_URL, token=None,
+                 batch_size=50, workers=4, on_error=None):
+    """Fetch stale issues into *cache*.
+
+    Returns the keys of issues where the title or state changed.
+    Batches that fail are passed to ``on_error(project, exc)``
+    and existing entries are kept.
+    """
+    now = time.time()
+    by_project = {}
+    for key in cache.stale(keys, now):
+        project, issue_id = parse_issue_key(key)
+        if project and issue_id.isdigit():
+            by_project.setdefault(project, []).append(int(issue_id))
+    batches = [
+        (project, numbers[i:i + batch_size])
+        for project, numbers in sorted(by_project.items())
+        for i in range(0, len(numbers), batch_size)
+    ]
+    if not batches:
+        return set()
+
+    def fetch(batch):
+        project, numbers = batch
+        etag = cache.etags.get(batch_key(project, numbers))
+        try:
+            return batch, fetch_batch(url, project, numbers, token, etag)
+        except (OSError, ValueError) as exc:
+            return batch, exc
+
+    changed = set()
+    with ThreadPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+        for (project, numbers), result in pool.map(fetch, batches):
+            if isinstance(result, Exception):
+                if on_error is not None:
+                    on_error(project, result)
+                continue
+            etag, issues = result
+            if etag:
+                cache.etags[batch_key(project, numbers)] = etag
+                cache.changed = True
+            for number in numbers:
+                key = issue_key(project, number)
+                if issues is None:
+                    if cache.get(key) is not None:
+                        cache.touch(key, now)
+                    continue
+                title, state = issues[number] or (None, None)
+                if cache.update(key, title, state, now):
+                    changed.add(key)
+    return changed
@@ -1,58 +1,391 @@
-"""Stolen from sphinxcontrib-issuetracker.
+r"""Stolen from sphinxcontrib-issuetracker.
 
 Had to modify this as the original will make one Github API request
 per issue, which is not at all needed if we just want to link to issues.
 
+``github_issue_pattern`` can also be a list of patterns, which are then
+compiled into a single regex so that text is only scanned once.
+
+Text is only searched if it contains a literal part of the pattern
+(e.g. ``ssue #`` for the default pattern), and documents are skipped
+entirely if neither their source nor ``rst_prolog``/``rst_epilog``
+contain it, and the source has no ``include`` or ``auto*`` directives
+that could add more text.
+
+Issues and pull requests of other projects are found using
+``github_issue_patterns``, a list of ``(pattern, project, kind)``
+tuples where *kind* is ``'issue'`` (the default) or ``'pr'``.
+The project can also be taken from a group named ``project``:
+
+.. code-block:: python
+
+    github_issue_patterns = [
+        (r'(?P<project>celery/[\w.-]+)#(\d+)', None),
+        (r'py-amqp#(\d+)', 'celery/py-amqp'),
+        (r'[Pp]ull request #(\d+)', None, 'pr'),
+    ]
+
+All patterns are combined with ``github_issue_pattern`` into a single
+regex, so each text node is still scanned once.  The ``:issue:`` and
+``:pr:`` roles accept ``owner/repo#123`` or ``repo#123`` targets,
+where the owner defaults to that of ``github_project``.
+
+By default matches become pending cross-references, resolved by the
+``github`` domain when the document is written.  As the URL of an
+issue only depends on ``github_project`` and the issue id, set
+``github_issue_references = 'direct'`` to turn matches into final
+references when the document is read instead.  The ``:issue:`` role
+(or ``:github:issue:``) always creates cross-references.
+
+Issue titles and states can be fetched from the GitHub GraphQL API
+by setting ``github_issue_titles = True``, and are then added to the
+links as a tooltip and an ``issue-open``/``issue-closed`` class.
+Issues are fetched in batches and cached on disk, see
+:mod:`sphinx_celery.github_api`, and builds where the cache is fresh
+make no requests at all:
+
+- ``github_token``: API token, defaults to the ``GITHUB_TOKEN``
+  environment variable.
+- ``github_api_url``: GraphQL endpoint.
+- ``github_issue_cache``: Path of the cache, defaults to
+  ``github_issues.json`` in the doctree directory.
+- ``github_issue_cache_ttl``: Seconds before cached issues are
+  fetched again (default one day, :const:`None` to never expire).
+- ``github_issue_batch_size``, ``github_issue_fetch_workers``:
+  Issues per query and number of concurrent queries.
+
 """
 
+import os
 import re
 from collections import namedtuple
+from functools import lru_cache
 
 from docutils import nodes
 from docutils.transforms import Transform
 from sphinx.addnodes import pending_xref
+from sphinx.config import ENUM
+from sphinx.domains import Domain
 from sphinx.roles import XRefRole
+from sphinx.util import logging
+
+from .github_api import GRAPHQL_URL, IssueCache, fetch_issues, issue_key
+from .utils import get_env_store, per_document_env_store
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # pragma: no cover
+    import sre_parse
+
+#: Directives that may add text not in the source of the document.
+RE_EXTERNAL_CONTENT = re.compile(
+    r'^[ \t]*\.\.[ \t]+(?:[\w-]+:)?(?:include|auto\w+)::', re.MULTILINE)
+
+#: Text in these elements is never searched for issue references.
+SKIP_NODES = (
+    nodes.literal, nodes.FixedTextElement, nodes.reference, pending_xref,
+)
+
+#: Global inline flags, e.g. ``(?i)``, replaced by scoped flags when combined.
+RE_GLOBAL_FLAGS = re.compile(r'^\(\?[aiLmsux]+\)')
+
+SCOPED_FLAGS = (
+    (re.IGNORECASE, 'i'),
+    (re.MULTILINE, 'm'),
+    (re.DOTALL, 's'),
+    (re.VERBOSE, 'x'),
+)
+
+#: Named groups, removed when patterns are combined.
+RE_NAMED_GROUP = re.compile(r'\(\?P<\w+>')
+
+#: Target of the :issue: and :pr: roles, e.g. ``celery/kombu#123``.
+RE_ROLE_TARGET = re.compile(
+    r'^(?:(?:(?P<owner>[\w.-]+)/)?(?P<repo>[\w.-]+)?#)?(?P<id>\d+)$')
 
 URL = 'https://github.com/{project}/issues/{issue_id}'
 
-Issue = namedtuple('Issue', ('id', 'title', 'url'))
+URLS = {
+    'issue': URL,
+    'pr': 'https://github.com/{project}/pull/{issue_id}',
+}
+
+CACHE_FILENAME = 'github_issues.json'
+
+ERR_FETCH = 'github_issues: Cannot fetch issues of {0}: {1}'
+
+logger = logging.getLogger(__name__)
+
+Issue = namedtuple('Issue', ('id', 'title', 'url', 'key'))
+
+
+def role_project(target, github_project):
+    """Return ``(project, issue_id)`` for an issue role target.
+
+    The target is an issue number, optionally prefixed by
+    ``owner/repo#`` or ``repo#``, where the owner then defaults
+    to the owner of *github_project*.
+    """
+    match = RE_ROLE_TARGET.match(target.strip())
+    if match is None:
+        return github_project, target
+    owner, repo, issue_id = match.group('owner', 'repo', 'id')
+    if repo is None:
+        return github_project, issue_id
+    if owner is None:
+        owner = (github_project or '').partition('/')[0]
+    return f'{owner}/{repo}', issue_id
 
 
 class IssueRole(XRefRole):
     innernodeclass = nodes.inline
 
+    def process_link(self, env, refnode, has_explicit_title, title, target):
+        project, issue_id = role_project(target, env.config.github_project)
+        refnode['github_project'] = project
+        return title, issue_id
+
+    def result_nodes(self, document, env, node, is_ref):
+        # the bare :issue: and :pr: roles have no domain of their own.
+        if is_ref:
+            node['refdomain'] = GitHubDomain.name
+            add_issue(env, env.docname, node['github_project'],
+                      node['reftarget'])
+        return [node], []
+
+
+class GitHubDomain(Domain):
+    """Domain for references to GitHub issues."""
+
+    name = 'github'
+    label = 'GitHub'
+    roles = {kind: IssueRole() for kind in URLS}
+
+    def clear_doc(self, docname):
+        pass
+
+    def merge_domaindata(self, docnames, otherdata):
+        pass
+
+    def resolve_xref(self, env, fromdocname, builder,
+                     typ, target, node, contnode):
+        if typ not in URLS:
+            return None
+        return resolve_issue_reference(builder.app, env, node, contnode)
+
+    def resolve_any_xref(self, env, fromdocname, builder,
+                         target, node, contnode):
+        return []
+
+
+def add_issue(env, docname, project, issue_id):
+    get_env_store(env, 'github_issues').setdefault(docname, set()).add(
+        issue_key(project, issue_id))
+
+
+def required_literal(pattern):
+    """Return text that every match of a compiled *pattern* contains.
+
+    This is the longest run of literal characters
+    at the top level of the pattern, or :const:`None`.
+    """
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+    runs, run = [], []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+        else:
+            runs.append(''.join(run))
+            run = []
+    runs.append(''.join(run))
+    literal = max(runs, key=len)
+    if not literal:
+        return None
+    return literal.lower() if pattern.flags & re.IGNORECASE else literal
+
+
+class IssueScanner:
+    """Find issue references of one or more patterns in a single pass.
+
+    *patterns* are ``(pattern, project, kind)`` tuples.  The issue id
+    is the group named ``id`` of the pattern, or the first group that
+    is not named ``project``.  If there is a group named ``project``
+    it overrides the project of the entry.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = [
+            (re.compile(pattern) if isinstance(pattern, str) else pattern,
+             project, kind)
+            for pattern, project, kind in patterns
+        ]
+        regexes = [regex for regex, _, _ in self.patterns]
+        # (literal, ignorecase) pairs, literals of patterns ignoring
+        # case are lowercase and compared to the lowercased text.
+        literals = [
+            (required_literal(regex), bool(regex.flags & re.IGNORECASE))
+            for regex in regexes
+        ]
+        self.literals = (
+            None if any(literal is None for literal, _ in literals)
+            else literals)
+        if len(self.patterns) == 1:
+            self.regex = regexes[0]
+            self.groups = {None: self._groups(0, *self.patterns[0])}
+        else:
+            self.regex, self.groups = self._combine(self.patterns)
+
+    def _groups(self, offset, regex, project, kind):
+        project_group = regex.groupindex.get('project')
+        id_group = regex.groupindex.get('id') or next(
+            (i for i in range(1, regex.groups + 1) if i != project_group),
+            None)
+        if id_group is None:
+            raise ValueError(
+                f'github_issue_patterns: No issue id group in '
+                f'{regex.pattern!r}')
+        return (
+            offset + id_group,
+            offset + project_group if project_group else None,
+            project, kind,
+        )
+
+    def _combine(self, patterns):
+        # Patterns are wrapped in a group each, and the groups of the
+        # pattern follow the wrapping group.  Group names are removed
+        # as they would clash, group numbers are not affected by this.
+        parts, groups, index = [], {}, 1
+        for regex, project, kind in patterns:
+            flags = ''.join(
+                char for flag, char in SCOPED_FLAGS if regex.flags & flag)
+            source = RE_NAMED_GROUP.sub(
+                '(', RE_GLOBAL_FLAGS.sub('', regex.pattern))
+            if flags:
+                source = f'(?{flags}:{source})'
+            parts.append(f'({source})')
+            groups[index] = self._groups(index, regex, project, kind)
+            index += regex.groups + 1
+        return re.compile('|'.join(parts)), groups
+
+    def candidates(self, text):
+        if self.literals is None:
+            return True
+        lowered = None
+        for literal, ignorecase in self.literals:
+            if ignorecase:
+                if lowered is None:
+                    lowered = text.lower()
+                if literal in lowered:
+                    return True
+            elif literal in text:
+                return True
+        return False
+
+    def finditer(self, text):
+        """Yield ``(match, issue_id, project, kind)`` tuples.
+
+        *project* is :const:`None` if neither the pattern nor
+        the entry specify one.
+        """
+        single = self.groups.get(None)
+        for match in self.regex.finditer(text):
+            id_group, project_group, project, kind = (
+                single or self.groups[match.lastindex])
+            if project_group is not None:
+                project = match.group(project_group) or project
+            yield match, match.group(id_group), project, kind
+
+
+def pattern_entry(entry):
+    if isinstance(entry, (str, re.Pattern)):
+        entry = (entry,)
+    pattern, project, kind = tuple(entry) + (None, 'issue')[len(entry) - 1:]
+    if kind not in URLS:
+        raise ValueError(f'github_issue_patterns: Unknown kind {kind!r}')
+    return pattern, project, kind
+
+
+@lru_cache(maxsize=None)
+def _get_scanner(patterns):
+    return IssueScanner(patterns)
+
+
+def get_scanner(config):
+    patterns = config.github_issue_pattern
+    if isinstance(patterns, (str, re.Pattern)):
+        patterns = [patterns]
+    return _get_scanner(tuple(
+        [(pattern, None, 'issue') for pattern in patterns] +
+        [pattern_entry(entry) for entry in config.github_issue_patterns]
+    ))
+
+
+def find_candidates(document, scanner):
+    # Text nodes that may contain issue references, not descending
+    # into literals.  Collected up front as the tree is modified later.
+    candidates = []
+    stack = [document]
+    while stack:
+        for child in stack.pop().children:
+            if isinstance(child, nodes.Text):
+                if scanner.candidates(child):
+                    candidates.append(child)
+            elif not isinstance(child, SKIP_NODES):
+                stack.append(child)
+    return candidates
+
+
+def check_source(app, docname, source):
+    # Documents without candidate text are skipped by the transform.
+    # rst_prolog and rst_epilog are added to the source when parsed.
+    text = '\n'.join(filter(None, (
+        app.config.rst_prolog, source[0], app.config.rst_epilog)))
+    app.env.temp_data['github_issues_candidate'] = bool(
+        get_scanner(app.config).candidates(text) or
+        RE_EXTERNAL_CONTENT.search(text)
+    )
+
 
 class Issues(Transform):
     default_priority = 999
 
     def apply(self):
-        config = self.document.settings.env.config
+        env = self.document.settings.env
+        config = env.config
         github_project = config.github_project
-        issue_pattern = config.github_issue_pattern
-        if isinstance(issue_pattern, str):
-            issue_pattern = re.compile(issue_pattern)
-        for node in self.document.traverse(nodes.Text):
+        direct = config.github_issue_references == 'direct'
+        if not env.temp_data.get('github_issues_candidate', True):
+            return
+        scanner = get_scanner(config)
+        issues = set()
+        for node in find_candidates(self.document, scanner):
             parent = node.parent
-            if isinstance(parent, (nodes.literal, nodes.FixedTextElement)):
-                continue
             text = str(node)
             new_nodes = []
             last_issue_ref_end = 0
-            for match in issue_pattern.finditer(text):
+            for match, issue_id, project, kind in scanner.finditer(text):
+                project = project or github_project
                 head = text[last_issue_ref_end:match.start()]
                 if head:
                     new_nodes.append(nodes.Text(head))
                 last_issue_ref_end = match.end()
+                issues.add((project, issue_id))
                 issuetext = match.group(0)
-                issue_id = match.group(1)
+                contnode = nodes.inline(
+                    issuetext, issuetext, classes=['xref', kind])
+                if direct:
+                    new_nodes.append(make_issue_reference(
+                        make_issue(project, issue_id, kind=kind), contnode))
+                    continue
                 refnode = pending_xref()
                 refnode['reftarget'] = issue_id
-                refnode['reftype'] = 'issue'
+                refnode['reftype'] = kind
                 refnode['refdomain'] = 'github'
-                refnode['github_project'] = github_project
-                reftitle = issuetext
-                refnode.append(nodes.inline(
-                    issuetext, reftitle, classes=['xref', 'issue']))
+                refnode['github_project'] = project
+                refnode.append(contnode)
                 new_nodes.append(refnode)
             if not new_nodes:
                 continue
@@ -60,11 +393,20 @@ class Issues(Transform):
             if tail:
                 new_nodes.append(nodes.Text(tail))
             parent.replace(node, new_nodes)
+        for project, issue_id in issues:
+            add_issue(env, env.docname, project, issue_id)
+
+
+def make_issue(project, issue_id, title=None, kind='issue'):
+    return Issue(issue_id, title,
+                 URLS[kind].format(project=project, issue_id=issue_id),
+                 issue_key(project, issue_id))
 
 
 def make_issue_reference(issue, content_node):
     reference = nodes.reference()
     reference['refuri'] = issue.url
+    reference['github_issue'] = issue.key
     if issue.title:
         reference['reftitle'] = issue.title
     reference.append(content_node)
@@ -72,13 +414,13 @@ def make_issue_reference(issue, content_node):
 
 
 def resolve_issue_reference(app, env, node, contnode):
-    if node['reftype'] != 'issue':
+    kind = node['reftype']
+    if kind not in URLS:
         return
+    project = node.get('github_project') or env.config.github_project
     issue_id = node['reftarget']
-    project = node['github_project']
-
-    issue = Issue(issue_id, None, URL.format(project=project,
-                                             issue_id=issue_id))
+    cached = get_cached_issue(app, issue_key(project, issue_id)) or {}
+    issue = make_issue(project, issue_id, cached.get('title'), kind)
     conttext = str(contnode[0])
     formatted_conttext = nodes.Text(conttext.format(issue=issue))
     formatted_contnode = nodes.inline(conttext, formatted_conttext,
@@ -86,20 +428,82 @@ def resolve_issue_reference(app, env, node, contnode):
     return make_issue_reference(issue, formatted_contnode)
 
 
+def get_cache_path(app):
+    return (app.config.github_issue_cache or
+            os.path.join(app.doctreedir, CACHE_FILENAME))
+
+
+def get_cached_issue(app, key):
+    cache = getattr(app, 'github_issue_cache', None)
+    return cache.get(key) if cache is not None else None
+
+
+def fetch_issue_metadata(app, env):
+    config = app.config
+    if not config.github_issue_titles:
+        return []
+    cache = app.github_issue_cache = IssueCache(
+        get_cache_path(app), config.github_issue_cache_ttl)
+    issues = get_env_store(env, 'github_issues')
+    changed = fetch_issues(
+        cache, set().union(*issues.values()),
+        url=config.github_api_url,
+        token=config.github_token or os.environ.get('GITHUB_TOKEN'),
+        batch_size=config.github_issue_batch_size,
+        workers=config.github_issue_fetch_workers,
+        on_error=lambda project, exc: logger.warning(
+            ERR_FETCH.format(project, exc)),
+    )
+    cache.save()
+    # documents linking to issues that changed are written again.
+    return sorted(
+        docname for docname, keys in issues.items() if keys & changed)
+
+
+def add_issue_metadata(app, doctree, docname):
+    if getattr(app, 'github_issue_cache', None) is None:
+        return
+    for node in doctree.findall(nodes.reference):
+        if 'github_issue' not in node:
+            continue
+        cached = get_cached_issue(app, node['github_issue'])
+        if cached is None:
+            continue
+        if cached['title']:
+            node['reftitle'] = cached['title']
+        if cached['state']:
+            node['classes'].append(f'issue-{cached["state"].lower()}')
+
+
 def init_transformer(app):
     app.add_transform(Issues)
 
 
 def setup(app):
     app.require_sphinx('1.0')
-    app.add_role('issue', IssueRole())
+    app.add_domain(GitHubDomain)
+    for kind in URLS:
+        app.add_role(kind, IssueRole())
 
     app.add_config_value('github_project', None, 'env')
     app.add_config_value('github_issue_pattern',
                          re.compile(r'[Ii]ssue #(\d+)'), 'env')
+    app.add_config_value('github_issue_patterns', [], 'env')
+    app.add_config_value('github_issue_references', 'xref', 'env',
+                         ENUM('direct', 'xref'))
+    app.add_config_value('github_issue_titles', False, 'html')
+    app.add_config_value('github_api_url', GRAPHQL_URL, '')
+    app.add_config_value('github_token', None, '')
+    app.add_config_value('github_issue_cache', None, '')
+    app.add_config_value('github_issue_cache_ttl', 24 * 60 * 60, '')
+    app.add_config_value('github_issue_batch_size', 50, '')
+    app.add_config_value('github_issue_fetch_workers', 4, '')
 
     app.connect('builder-inited', init_transformer)
-    app.connect('missing-reference', resolve_issue_reference)
+    app.connect('source-read', check_source)
+    per_document_env_store(app, 'github_issues')
+    app.connect('env-updated', fetch_issue_metadata)
+    app.connect('doctree-resolved', add_issue_metadata)
 
     return {
         'parallel_read_safe': True
@@ -0,0 +1,197 @@
+"""Measure the import cost of third-party dependencies of a package.
+
+Used by :func:`sphinx_celery.conf.build_config` to generate
+``autodoc_mock_imports`` for optional dependencies that are expensive
+to import, or not installed at all.
+
+Third-party modules imported anywhere in the package are found by
+parsing its source, and are imported in a single subprocess run with
+``python -X importtime``.  Results are cached in a JSON file by the
+installed version of every module, so they are only measured again
+when a dependency is upgraded.
+
+Nothing is measured if the ``SPHINX_CELERY_SKIP_IMPORT_COSTS``
+environment variable is set, which :mod:`sphinx_celery.check` does
+as it does not import anything.
+"""
+
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+import sysconfig
+from importlib import metadata
+
+__all__ = ['expensive_imports', 'find_imports', 'measure_import_costs']
+
+#: Modules slower to import than this (in seconds) are mocked.
+DEFAULT_THRESHOLD = 0.1
+
+SKIP_ENVVAR = 'SPHINX_CELERY_SKIP_IMPORT_COSTS'
+
+RE_IMPORTTIME = re.compile(
+    r'^import time:\s+\d+ \|\s+(?P<cumulative>\d+) \| \s*(?P<name>\S+)$')
+
+# importlib.import_module() is not reported by -X importtime.
+IMPORT_SCRIPT = '''\
+import sys
+for name in sys.argv[1:]:
+    try:
+        __import__(name)
+    except Exception:
+        print(name)
+'''
+
+
+def is_stdlib(name):
+    names = getattr(sys, 'stdlib_module_names', None)
+    if names is not None:
+        return name in names or name in sys.builtin_module_names
+    # Python < 3.10
+    if name in sys.builtin_module_names:
+        return True
+    stdlib = sysconfig.get_paths()['stdlib']
+    for entry in (os.path.join(stdlib, name),
+                  os.path.join(stdlib, f'{name}.py')):
+        if os.path.exists(entry):
+            return True
+    return False
+
+
+def find_imports(path):
+    """Return top-level names of modules imported below *path*."""
+    names = set()
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = [d for d in dirnames if d.isidentifier()]
+        for filename in filenames:
+            if not filename.endswith('.py'):
+                continue
+            filepath = os.path.join(dirpath, filename)
+            try:
+                with open(filepath, 'rb') as fh:
+                    tree = ast.parse(fh.read(), filepath)
+            except (OSError, SyntaxError, ValueError):
+                continue
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Import):
+                    names.update(
+                        alias.name.partition('.')[0] for alias in node.names)
+                elif isinstance(node, ast.ImportFrom) and (
+                        not node.level and node.module):
+                    names.add(node.module.partition('.')[0])
+    return names
+
+
+def third_party_imports(package):
+    """Return third-party modules imported by *package*."""
+    names = set()
+    for path in getattr(package, '__path__', ()):
+        names |= find_imports(path)
+    names.discard(package.__name__)
+    return sorted(
+        name for name in names
+        if name != '__future__' and not is_stdlib(name)
+    )
+
+
+def packages_distributions():
+    try:
+        return metadata.packages_distributions()
+    except AttributeError:
+        # Python < 3.10
+        return {}
+
+
+def module_version(name, distributions=None):
+    if distributions is None:
+        distributions = packages_distributions()
+    for dist in distributions.get(name, ()):
+        try:
+            return metadata.version(dist)
+        except metadata.PackageNotFoundError:
+            pass
+    return None
+
+
+def measure_import_costs(names, python=sys.executable):
+    """Import *names* in a subprocess and return their import times.
+
+    Returns a mapping of name to cumulative import time in seconds,
+    or :const:`None` for modules that cannot be imported.
+    """
+    if not names:
+        return {}
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        entry for entry in sys.path if entry))
+    process = subprocess.run(
+        [python, '-X', 'importtime', '-c', IMPORT_SCRIPT] + list(names),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        env=env,
+    )
+    missing = set(process.stdout.split())
+    costs = dict.fromkeys(names, 0.0)
+    for line in process.stderr.splitlines():
+        match = RE_IMPORTTIME.match(line)
+        if match and match.group('name') in costs:
+            # modules imported by an earlier one are listed nested.
+            costs[match.group('name')] = max(
+                costs[match.group('name')],
+                int(match.group('cumulative')) / 1e6,
+            )
+    return {
+        name: None if name in missing else cost
+        for name, cost in costs.items()
+    }
+
+
+def load_cache(path):
+    try:
+        with open(path) as fh:
+            cache = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('python') != sys.version:
+        return {}
+    return cache.get('modules', {})
+
+
+def save_cache(path, modules):
+    os.makedirs(os.path.dirname(path) or os.curdir, exist_ok=True)
+    with open(path, 'w') as fh:
+        json.dump({'python': sys.version, 'modules': modules}, fh,
+                  indent=2, sort_keys=True)
+
+
+def expensive_imports(package, cache_path, threshold=DEFAULT_THRESHOLD,
+                      exclude=()):
+    """Return third-party modules of *package* to mock.
+
+    These are modules that are not installed, or take longer than
+    *threshold* seconds to import.  Modules in *exclude*, and modules
+    already imported (e.g. by the package itself) are never mocked.
+    """
+    candidates = [
+        name for name in third_party_imports(package)
+        if name not in sys.modules and name not in exclude
+    ]
+    distributions = packages_distributions()
+    versions = {
+        name: module_version(name, distributions) for name in candidates
+    }
+    cache = load_cache(cache_path)
+    stale = [
+        name for name in candidates
+        if name not in cache or cache[name]['version'] != versions[name]
+    ]
+    if stale:
+        for name, cost in measure_import_costs(stale).items():
+            cache[name] = {'version': versions[name], 'cost': cost}
+        save_cache(cache_path, cache)
+    return sorted(
+        name for name in candidates
+        if cache[name]['cost'] is None or cache[name]['cost'] >= threshold
+    )
@@ -0,0 +1,151 @@
+"""Profile the modules imported by autodoc.
+
+:class:`ImportProfiler` records the wall time and memory allocated
+while a module is imported, and the tree of modules it imports in turn
+with the cumulative time spent in each (like ``python -X importtime``).
+
+Nested imports are recorded by replacing :func:`builtins.__import__`
+while profiling, so modules imported with :func:`importlib.import_module`
+are only included in the time of the module importing them.
+"""
+
+import builtins
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+__all__ = ['ImportProfiler', 'write_import_profile']
+
+TEXT_FILENAME = 'import_profile.txt'
+JSON_FILENAME = 'import_profile.json'
+
+#: Nested imports faster than this (in seconds) are left out of the text.
+TEXT_THRESHOLD = 0.001
+
+HEADER_FORMAT = '{time:>10} {memory:>10}  {module}'
+ROW_FORMAT = '{time:>7.1f} ms {memory:>7.1f} MiB  {module}'
+TREE_FORMAT = '{time:>7.1f} ms {blank:>11}  {indent}{module}'
+
+
+def resolve_name(name, globals, level):
+    if not level:
+        return name
+    package = (globals or {}).get('__package__') or ''
+    base = package.rsplit('.', level - 1)[0] if level > 1 else package
+    return f'{base}.{name}' if name else base
+
+
+class ImportProfiler:
+    """Record the import tree of the modules imported in a block.
+
+    Use as a context manager, :attr:`tree` is then a list of
+    ``[name, seconds, children]`` lists.
+    """
+
+    def __init__(self):
+        self.tree = []
+        self.elapsed = None
+        self.memory = None
+        self.peak = None
+        self._stack = [self.tree]
+        self._import = None
+
+    def __enter__(self):
+        self._tracing = tracemalloc.is_tracing()
+        if not self._tracing:
+            tracemalloc.start()
+        self._memory = tracemalloc.get_traced_memory()[0]
+        if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+            tracemalloc.reset_peak()
+        self._import = builtins.__import__
+        builtins.__import__ = self._profile_import
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self._start
+        builtins.__import__ = self._import
+        memory, peak = tracemalloc.get_traced_memory()
+        self.memory = memory - self._memory
+        self.peak = peak - self._memory
+        if not self._tracing:
+            tracemalloc.stop()
+
+    def _profile_import(self, name, globals=None, locals=None,
+                        fromlist=(), level=0):
+        fullname = resolve_name(name, globals, level)
+        module = sys.modules.get(fullname)
+        if module is not None:
+            # from package import submodule
+            fullname = ', '.join(
+                f'{fullname}.{item}' for item in fromlist or ()
+                if item != '*' and not hasattr(module, item)
+            )
+            if not fullname:
+                return self._import(name, globals, locals, fromlist, level)
+        node = [fullname, 0.0, []]
+        self._stack[-1].append(node)
+        self._stack.append(node[2])
+        start = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            node[1] = time.perf_counter() - start
+            self._stack.pop()
+
+    def as_dict(self, module):
+        return {
+            'module': module,
+            'time': self.elapsed,
+            'memory': self.memory,
+            'peak': self.peak,
+            'tree': self.tree,
+        }
+
+
+def collect_profiles(profiles):
+    """Return one profile per module sorted by time, slowest first.
+
+    Modules imported by several documents are only slow the first time,
+    so the slowest profile of each module is used.
+    """
+    by_module = {}
+    for profile in profiles:
+        previous = by_module.get(profile['module'])
+        if previous is None or profile['time'] > previous['time']:
+            by_module[profile['module']] = profile
+    return sorted(by_module.values(), key=lambda p: p['time'], reverse=True)
+
+
+def format_tree(tree, depth=1, threshold=TEXT_THRESHOLD):
+    for name, seconds, children in tree:
+        if seconds < threshold:
+            continue
+        yield TREE_FORMAT.format(
+            time=seconds * 1000.0, blank='', indent='  ' * depth,
+            module=name)
+        yield from format_tree(children, depth + 1, threshold)
+
+
+def format_profiles(profiles):
+    yield HEADER_FORMAT.format(time='time', memory='memory', module='module')
+    for profile in profiles:
+        yield ROW_FORMAT.format(
+            time=profile['time'] * 1000.0,
+            memory=profile['memory'] / (1024.0 * 1024.0),
+            module=profile['module'],
+        )
+        yield from format_tree(profile['tree'])
+
+
+def write_import_profile(profiles, outdir):
+    """Write the text and JSON reports to *outdir*."""
+    profiles = collect_profiles(profiles)
+    os.makedirs(outdir, exist_ok=True)
+    with open(os.path.join(outdir, TEXT_FILENAME), 'w') as fh:
+        for line in format_profiles(profiles):
+            fh.write(line + '\n')
+    with open(os.path.join(outdir, JSON_FILENAME), 'w') as fh:
+        json.dump(profiles, fh, indent=1)
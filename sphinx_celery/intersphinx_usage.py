@@ -0,0 +1,133 @@
+"""
+
+Intersphinx Usage Tracking
+==========================
+
+Records which intersphinx projects references in the documentation
+resolve to, and reports mappings that are not used by any document.
+
+The usage is kept in a JSON file by document, and documents that are
+not written again keep their previous usage, so the file is also
+complete after incremental builds.
+
+:func:`sphinx_celery.conf.build_config` can then prune the intersphinx
+mapping to the projects that are used (``prune_intersphinx=True``),
+so that other inventories are not fetched, parsed and kept in memory.
+References added to a pruned project do not resolve until the usage
+file is removed, so do a build without pruning before releasing.
+
+Configuration
+-------------
+
+intersphinx_usage_file
+~~~~~~~~~~~~~~~~~~~~~~
+
+Path of the usage file.
+
+Default is ``intersphinx_usage.json`` in the doctree directory.
+
+"""
+
+import json
+import os
+
+from docutils import nodes
+from sphinx.util import logging
+
+__all__ = ['load_usage', 'used_projects']
+
+USAGE_FILENAME = 'intersphinx_usage.json'
+
+INFO_UNUSED = 'intersphinx: Unused mappings: {0}'
+
+logger = logging.getLogger(__name__)
+
+
+def load_usage(path):
+    """Return the usage file as ``{docname: {project: count}}``."""
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def used_projects(path):
+    """Return names of the projects used, or :const:`None` if unknown."""
+    usage = load_usage(path)
+    if not usage:
+        return None
+    return set().union(*usage.values())
+
+
+def mapping_uris(mapping):
+    # Sphinx normalizes entries to (name, (uri, locations)).
+    uris = {}
+    for name, value in mapping.items():
+        if (isinstance(value[1], (tuple, list)) and len(value[1]) == 2 and
+                isinstance(value[1][1], (tuple, list))):
+            uris[name] = value[1][0]
+        else:
+            uris[name] = value[0]
+    return uris
+
+
+def get_usage_path(app):
+    return (app.config.intersphinx_usage_file or
+            os.path.join(app.doctreedir, USAGE_FILENAME))
+
+
+def load(app):
+    app.intersphinx_usage = load_usage(get_usage_path(app))
+    # longest URIs first, so that nested projects are matched first.
+    app.intersphinx_uris = sorted(
+        ((uri, name) for name, uri in mapping_uris(
+            getattr(app.config, 'intersphinx_mapping', None) or {}).items()),
+        key=lambda item: len(item[0]), reverse=True,
+    )
+
+
+def record_usage(app, doctree, docname):
+    uris = app.intersphinx_uris
+    if not uris:
+        return
+    counts = {}
+    for node in doctree.findall(nodes.reference):
+        refuri = node.get('refuri')
+        if not refuri or node.get('internal'):
+            continue
+        for uri, name in uris:
+            if refuri.startswith(uri):
+                counts[name] = counts.get(name, 0) + 1
+                break
+    app.intersphinx_usage[docname] = counts
+
+
+def save(app, exception):
+    if exception is not None or not hasattr(app, 'intersphinx_usage'):
+        return
+    usage = {
+        docname: counts
+        for docname, counts in sorted(app.intersphinx_usage.items())
+        if docname in app.env.all_docs
+    }
+    path = get_usage_path(app)
+    os.makedirs(os.path.dirname(path) or os.curdir, exist_ok=True)
+    with open(path, 'w') as fh:
+        json.dump(usage, fh, indent=1, sort_keys=True)
+    used = set().union(*usage.values())
+    unused = sorted(name for _, name in app.intersphinx_uris
+                    if name not in used)
+    if unused:
+        logger.info(INFO_UNUSED.format(', '.join(unused)))
+
+
+def setup(app):
+    app.add_config_value('intersphinx_usage_file', None, '')
+    app.connect('builder-inited', load)
+    app.connect('doctree-resolved', record_usage)
+    app.connect('build-finished', save)
+
+    return {
+        'parallel_read_safe': True,
+    }
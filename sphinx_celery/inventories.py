@@ -0,0 +1,367 @@
+"""
+
+Sphinx Celery Intersphinx Inventory Cache
+=========================================
+
+Keeps intersphinx inventories (``objects.inv``) in a directory shared
+by all builds, keyed by URL.  Inventories are fetched again after a TTL,
+sending the ``ETag`` and ``Last-Modified`` of the cached copy so that
+unchanged inventories are not downloaded.
+
+Enabled by passing ``intersphinx_cache=True`` (or the path of the
+cache directory) to :func:`sphinx_celery.conf.build_config`.
+When the builder is initialized, stale inventories of the intersphinx
+mapping are fetched, and the mapping is pointed at the cached files.
+Stale entries fall back to the cached file if the remote inventory
+cannot be fetched, so builds also work without network access.
+
+Configuration
+-------------
+
+inventories_cache_dir
+~~~~~~~~~~~~~~~~~~~~~
+
+Path of the cache directory.
+
+Default is ``$SPHINX_CELERY_INVENTORY_CACHE``, or
+``sphinx_celery/inventories`` in the user cache directory.
+
+inventories_cache_ttl
+~~~~~~~~~~~~~~~~~~~~~
+
+Seconds before cached inventories are fetched again,
+or :const:`None` to never fetch them again.
+
+Default is ``86400`` (a day).
+
+inventories_prefetch
+~~~~~~~~~~~~~~~~~~~~
+
+Fetch stale inventories concurrently before intersphinx loads them.
+
+Default is :const:`True`.
+
+Usage
+-----
+
+Fetch all inventories of the default intersphinx mapping, e.g. to
+populate a mirror for offline builds:
+
+.. code-block:: console
+
+    $ python -m sphinx_celery.inventories sync
+
+    $ python -m sphinx_celery.inventories sync --force python django
+
+List the cached inventories:
+
+.. code-block:: console
+
+    $ python -m sphinx_celery.inventories list
+
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import posixpath
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import atomic_write, default_cache_dir
+
+__all__ = ['InventoryCache', 'inventory_url']
+
+DEFAULT_TTL = 24 * 60 * 60
+
+CACHE_ENVVAR = 'SPHINX_CELERY_INVENTORY_CACHE'
+
+DEFAULT_WORKERS = 8
+
+USER_AGENT = 'sphinx_celery'
+
+INVENTORY_FILENAME = 'objects.inv'
+
+SYNC_FORMAT = '{status:>9}  {target}'
+LIST_FORMAT = '{age:>7}  {url}'
+
+
+def is_remote(location):
+    return location.startswith(('http://', 'https://'))
+
+
+def inventory_url(target, location=None):
+    """Return the URL of the inventory of an intersphinx mapping entry.
+
+    Returns :const:`None` if the inventory is a local file.
+    """
+    if location is None:
+        location = posixpath.join(target.rstrip('/'), INVENTORY_FILENAME)
+    return location if is_remote(location) else None
+
+
+class InventoryCache:
+    """Directory of inventories keyed by URL."""
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, timeout=30):
+        self.path = os.path.abspath(
+            path or default_cache_dir(CACHE_ENVVAR, 'inventories'))
+        self.ttl = ttl
+        self.timeout = timeout
+
+    def key(self, url):
+        return hashlib.sha1(url.encode()).hexdigest()
+
+    def inventory_path(self, url):
+        return os.path.join(self.path, f'{self.key(url)}.inv')
+
+    def meta_path(self, url):
+        return os.path.join(self.path, f'{self.key(url)}.json')
+
+    def meta(self, url):
+        try:
+            with open(self.meta_path(url)) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def entries(self):
+        try:
+            names = sorted(os.listdir(self.path))
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.path, name)) as fh:
+                        yield json.load(fh)
+                except (OSError, ValueError):
+                    pass
+
+    def exists(self, url):
+        return os.path.exists(self.inventory_path(url))
+
+    def is_fresh(self, url, now=None):
+        meta = self.meta(url)
+        if meta is None or not self.exists(url):
+            return False
+        if self.ttl is None:
+            return True
+        now = time.time() if now is None else now
+        return now - meta['fetched'] <= self.ttl
+
+    def fetch(self, url, force=False):
+        """Fetch inventory at *url* into the cache.
+
+        Returns ``'fetched'``, or ``'unchanged'`` if the server answered
+        with ``304 Not Modified``.
+        """
+        meta = (None if force or not self.exists(url) else self.meta(url))
+        request = urllib.request.Request(
+            url, headers={'User-Agent': USER_AGENT})
+        if meta is not None:
+            if meta.get('etag'):
+                request.add_header('If-None-Match', meta['etag'])
+            if meta.get('last_modified'):
+                request.add_header('If-Modified-Since', meta['last_modified'])
+        try:
+            with urllib.request.urlopen(
+                    request, timeout=self.timeout) as response:
+                data = response.read()
+                headers = response.headers
+        except urllib.error.HTTPError as exc:
+            if exc.code != 304 or meta is None:
+                raise
+            meta['fetched'] = time.time()
+            self._write_meta(url, meta)
+            return 'unchanged'
+        os.makedirs(self.path, exist_ok=True)
+        with atomic_write(self.inventory_path(url), 'wb') as fh:
+            fh.write(data)
+        self._write_meta(url, {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched': time.time(),
+        })
+        return 'fetched'
+
+    def _write_meta(self, url, meta):
+        os.makedirs(self.path, exist_ok=True)
+        with atomic_write(self.meta_path(url)) as fh:
+            json.dump(meta, fh)
+
+    def prefetch(self, urls, workers=DEFAULT_WORKERS, force=False):
+        """Fetch stale inventories concurrently.
+
+        Returns a mapping of URL to the result of :meth:`fetch`,
+        ``'fresh'``, or the exception if the inventory cannot be fetched.
+        """
+        urls = sorted(set(urls))
+        results = {}
+        stale = []
+        for url in urls:
+            if not force and self.is_fresh(url):
+                results[url] = 'fresh'
+            else:
+                stale.append(url)
+
+        def fetch(url):
+            try:
+                return url, self.fetch(url, force=force)
+            except (OSError, ValueError) as exc:
+                return url, exc
+
+        if stale:
+            with ThreadPoolExecutor(
+                    max_workers=min(workers, len(stale))) as pool:
+                results.update(pool.map(fetch, stale))
+        return results
+
+    def cached_locations(self, target, locations):
+        """Point inventory *locations* of an intersphinx entry at the cache.
+
+        Fresh inventories are used directly, stale ones are only used
+        if the remote inventory cannot be fetched.
+        """
+        result = []
+        for location in locations:
+            url = (inventory_url(target, location)
+                   if location is None or isinstance(location, str)
+                   else None)
+            if url is None or not self.exists(url):
+                result.append(location)
+            elif self.is_fresh(url):
+                result.append(self.inventory_path(url))
+            else:
+                result.extend([location, self.inventory_path(url)])
+        return tuple(result)
+
+
+def mapping_urls(mapping):
+    return {
+        name: url for name, url in (
+            (name, inventory_url(target, location))
+            for name, (target, location) in mapping.items()
+            if location is None or isinstance(location, str)
+        ) if url is not None
+    }
+
+
+def normalized_entries(mapping):
+    # the intersphinx mapping as normalized by sphinx.ext.intersphinx.
+    for key, (name, (target, locations)) in mapping.items():
+        if not isinstance(locations, (tuple, list)):
+            locations = (locations,)
+        yield key, name, target, locations
+
+
+def use_cached_inventories(app):
+    config = app.config
+    if not config.intersphinx_mapping:
+        return
+    cache = InventoryCache(
+        config.inventories_cache_dir, ttl=config.inventories_cache_ttl)
+    entries = list(normalized_entries(config.intersphinx_mapping))
+    if config.inventories_prefetch:
+        cache.prefetch(
+            url for _, _, target, locations in entries
+            for url in (
+                inventory_url(target, location) for location in locations
+                if location is None or isinstance(location, str))
+            if url is not None
+        )
+    for key, name, target, locations in entries:
+        config.intersphinx_mapping[key] = (
+            name, (target, cache.cached_locations(target, locations)))
+
+
+def setup(app):
+    app.setup_extension('sphinx.ext.intersphinx')
+    app.add_config_value('inventories_cache_dir', None, '')
+    app.add_config_value('inventories_cache_ttl', DEFAULT_TTL, '')
+    app.add_config_value('inventories_prefetch', True, '')
+    # before intersphinx loads the inventories.
+    app.connect('builder-inited', use_cached_inventories, priority=400)
+
+    return {
+        'parallel_read_safe': True,
+    }
+
+
+def sync(args):
+    from .conf import INTERSPHINX_MAPPING
+    cache = InventoryCache(args.cache_dir, ttl=args.ttl)
+    urls = mapping_urls(INTERSPHINX_MAPPING)
+    names = args.names or sorted(urls)
+    unknown = [name for name in names if name not in urls]
+    for name in unknown:
+        if not is_remote(name):
+            print(f'Unknown inventory: {name}', file=sys.stderr)
+            return 1
+        urls[name] = name
+    results = cache.prefetch(
+        [urls[name] for name in names],
+        workers=args.workers, force=args.force)
+    status = 0
+    for name in names:
+        result = results[urls[name]]
+        if isinstance(result, Exception):
+            status = 1
+            result = f'error: {result}'
+        print(SYNC_FORMAT.format(
+            status=result,
+            target=name if name == urls[name] else f'{name}  {urls[name]}',
+        ))
+    return status
+
+
+def list_cached(args):
+    cache = InventoryCache(args.cache_dir)
+    now = time.time()
+    for meta in cache.entries():
+        age = now - meta['fetched']
+        print(LIST_FORMAT.format(
+            age=f'{age / 3600.0:.1f}h', url=meta['url']))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m sphinx_celery.inventories',
+        description='Manage the intersphinx inventory cache.',
+    )
+    parser.add_argument(
+        '--cache-dir', help='(default: {0})'.format(
+            default_cache_dir(CACHE_ENVVAR, 'inventories')))
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sync_parser = commands.add_parser(
+        'sync', help='fetch stale inventories of the default mapping')
+    sync_parser.add_argument(
+        'names', nargs='*',
+        help='intersphinx names or inventory URLs (default: all)')
+    sync_parser.add_argument(
+        '-f', '--force', action='store_true',
+        help='fetch inventories even if they are fresh')
+    sync_parser.add_argument(
+        '--ttl', type=float, default=DEFAULT_TTL,
+        help=f'seconds before inventories are stale (default: {DEFAULT_TTL})')
+    sync_parser.add_argument(
+        '-w', '--workers', type=int, default=DEFAULT_WORKERS,
+        help=f'concurrent downloads (default: {DEFAULT_WORKERS})')
+    sync_parser.set_defaults(func=sync)
+
+    list_parser = commands.add_parser('list', help='list cached inventories')
+    list_parser.set_defaults(func=list_cached)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
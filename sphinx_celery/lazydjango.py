@@ -0,0 +1,149 @@
+"""
+
+Deferred Django Configuration
+=============================
+
+Configures Django only when the build needs it, instead of while
+``conf.py`` is evaluated.  Enabled by passing ``defer_django=True``
+to :func:`sphinx_celery.conf.build_config`.
+
+Django is configured the first time a module in the ``django``
+package is imported (e.g. when autodoc imports a module using
+Django models), right after that module is executed, or when one of
+the builders in ``lazydjango_builders`` is initialized.
+
+Configuration
+-------------
+
+lazydjango_settings
+~~~~~~~~~~~~~~~~~~~
+
+Name of the Django settings module, see ``django_settings``
+of :func:`~sphinx_celery.conf.build_config`.
+
+lazydjango_configure
+~~~~~~~~~~~~~~~~~~~~
+
+Settings to configure Django with if there is no settings module,
+see ``configure_django_settings``
+of :func:`~sphinx_celery.conf.build_config`.
+
+lazydjango_builders
+~~~~~~~~~~~~~~~~~~~
+
+Builders that always need Django, so it is configured
+as soon as the builder is initialized.
+
+Default is ``[]``.
+
+"""
+
+import importlib.util
+import sys
+import time
+
+from sphinx.util import logging
+
+__all__ = ['DjangoTrigger', 'DjangoLoader']
+
+INFO_CONFIGURED = 'lazydjango: Configured Django in {0:.2f}s ({1})'
+
+logger = logging.getLogger(__name__)
+
+
+class DjangoTrigger:
+    """Meta path finder configuring Django before it is first imported."""
+
+    def __init__(self, settings, configure):
+        self.settings = settings
+        self.configure = configure
+        self.configured = False
+
+    def install(self):
+        if not self.configured and self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        try:
+            sys.meta_path.remove(self)
+        except ValueError:
+            pass
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname != 'django' and not fullname.startswith('django.'):
+            return None
+        # find the module with the other finders.
+        self.uninstall()
+        spec = importlib.util.find_spec(fullname)
+        if spec is None or spec.loader is None:
+            return spec
+        spec.loader = DjangoLoader(
+            spec.loader, self, f'import of {fullname}')
+        return spec
+
+    def configure_django(self, reason):
+        if self.configured:
+            return
+        from .conf import configure_django
+        self.configured = True
+        self.uninstall()
+        start = time.monotonic()
+        configure_django(self.settings, **self.configure or {})
+        logger.info(INFO_CONFIGURED.format(time.monotonic() - start, reason))
+
+
+class DjangoLoader:
+    """Loader configuring Django after executing the module it loads.
+
+    Django is not configured before, as :func:`django.setup` imports
+    the module again, which would then be executed twice.
+    """
+
+    def __init__(self, loader, trigger, reason):
+        self.loader = loader
+        self.trigger = trigger
+        self.reason = reason
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.loader.exec_module(module)
+        self.trigger.configure_django(self.reason)
+
+
+def install_trigger(app, config):
+    if not (config.lazydjango_settings or config.lazydjango_configure):
+        return
+    app.lazydjango_trigger = DjangoTrigger(
+        config.lazydjango_settings, config.lazydjango_configure)
+    app.lazydjango_trigger.install()
+
+
+def configure_for_builder(app):
+    trigger = getattr(app, 'lazydjango_trigger', None)
+    if trigger is not None and (
+            app.builder.name in app.config.lazydjango_builders):
+        trigger.configure_django(f'{app.builder.name} builder')
+
+
+def uninstall_trigger(app, exception):
+    trigger = getattr(app, 'lazydjango_trigger', None)
+    if trigger is not None:
+        trigger.uninstall()
+
+
+def setup(app):
+    app.add_config_value('lazydjango_settings', None, '')
+    app.add_config_value('lazydjango_configure', None, '')
+    app.add_config_value('lazydjango_builders', [], '')
+    app.connect('config-inited', install_trigger)
+    app.connect('builder-inited', configure_for_builder)
+    app.connect('build-finished', uninstall_trigger)
+
+    return {
+        'parallel_read_safe': True,
+    }
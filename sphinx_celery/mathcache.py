@@ -0,0 +1,239 @@
+"""
+
+Math Render Cache
+=================
+
+Renders the formulas of :mod:`sphinx.ext.imgmath` once, into a cache
+directory shared by all builds (and branches) of all projects.
+
+Formulas are collected while documents are read.  Before documents
+are written, formulas missing from the cache are rendered by a pool
+of processes, and cached images are copied to where ``imgmath``
+looks for them, so that it only renders formulas itself if they fail
+to render (to report the error).
+
+Images are keyed by the LaTeX source (which includes the preamble and
+font size), the image format, and the commands and arguments used to
+render them (which include the DPI).
+
+Enabled by passing ``math_cache=True`` (or the path of the cache
+directory) to :func:`sphinx_celery.conf.build_config`.
+
+Configuration
+-------------
+
+mathcache_dir
+~~~~~~~~~~~~~
+
+Path of the cache directory.
+
+Default is ``$SPHINX_CELERY_MATH_CACHE``, or ``sphinx_celery/math``
+in the user cache directory.
+
+mathcache_workers
+~~~~~~~~~~~~~~~~~
+
+Number of processes, or :const:`None` for one per CPU.
+
+Default is :const:`None`.
+
+mathcache_inline_svg
+~~~~~~~~~~~~~~~~~~~~
+
+Render formulas as SVG and embed them in the pages
+(sets ``imgmath_image_format`` and ``imgmath_embed``),
+so that no images are requested.
+
+Default is :const:`False`.
+
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from docutils import nodes
+from sphinx.util import logging
+from sphinx.util.math import wrap_displaymath
+
+from .utils import (
+    atomic_write, default_cache_dir, get_env_store, per_document_env_store,
+)
+
+__all__ = ['render_formula']
+
+INFO_RENDERED = 'mathcache: Rendered {0} of {1} formulas'
+
+CACHE_ENVVAR = 'SPHINX_CELERY_MATH_CACHE'
+
+logger = logging.getLogger(__name__)
+
+
+def formula_source(node):
+    # as passed to imgmath.render_math()
+    if isinstance(node, nodes.math):
+        return '$' + node.astext() + '$'
+    if node.get('no-wrap', node.get('nowrap', False)):
+        return node.astext()
+    return wrap_displaymath(node.astext(), None, False)
+
+
+def render_options(config, image_format):
+    return {
+        'format': image_format,
+        'latex': [config.imgmath_latex] + list(config.imgmath_latex_args),
+        'convert': (
+            [config.imgmath_dvipng] + list(config.imgmath_dvipng_args)
+            if image_format == 'png' else
+            [config.imgmath_dvisvgm] + list(config.imgmath_dvisvgm_args)
+        ),
+        'preview': config.imgmath_use_preview,
+    }
+
+
+def cache_key(latex, options):
+    return hashlib.sha1(
+        json.dumps([latex, options], sort_keys=True).encode('utf-8'),
+    ).hexdigest()
+
+
+def render_formula(latex, options, out_path):
+    """Render the LaTeX document *latex* to the image *out_path*.
+
+    Returns :const:`None`, or the error if it cannot be rendered.
+    """
+    from sphinx.ext.imgmath import depth_re, depthsvg_re, write_svg_depth
+    from sphinx.util.png import write_png_depth
+
+    tempdir = tempfile.mkdtemp(suffix='-sphinx-mathcache')
+    try:
+        with open(os.path.join(tempdir, 'math.tex'), 'w',
+                  encoding='utf-8') as fh:
+            fh.write(latex)
+        command = list(options['latex'])
+        if os.path.basename(command[0]) != 'tectonic':
+            command.insert(1, '--interaction=nonstopmode')
+        subprocess.run(command + ['math.tex'], capture_output=True,
+                       cwd=tempdir, check=True)
+        dvipath = os.path.join(tempdir, (
+            'math.xdv'
+            if os.path.basename(command[0]) in ('xelatex', 'tectonic')
+            else 'math.dvi'))
+
+        tmp_path = os.path.join(tempdir, f'math.{options["format"]}')
+        command = [options['convert'][0], '-o', tmp_path]
+        if options['format'] == 'png':
+            command += ['-T', 'tight', '-z9']
+        command += options['convert'][1:]
+        if options['format'] == 'png' and options['preview']:
+            command.append('--depth')
+        process = subprocess.run(command + [dvipath], capture_output=True,
+                                 check=True, universal_newlines=True)
+        if options['preview']:
+            if options['format'] == 'png':
+                lines, regex = process.stdout.splitlines(), depth_re
+            else:
+                lines, regex = process.stderr.splitlines(), depthsvg_re
+            for line in lines:
+                match = regex.match(line)
+                if match and options['format'] == 'png':
+                    write_png_depth(tmp_path, int(match.group(1)))
+                    break
+                elif match:
+                    write_svg_depth(tmp_path, round(
+                        float(match.group(1)) * 100 / 72.27))
+                    break
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(tmp_path, 'rb') as src, atomic_write(
+                out_path, 'wb') as fh:
+            shutil.copyfileobj(src, fh)
+    except (OSError, subprocess.CalledProcessError) as exc:
+        return exc
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+    return None
+
+
+def _render(args):
+    return render_formula(*args)
+
+
+def collect_formulas(app, doctree):
+    formulas = {
+        formula_source(node)
+        for node in doctree.findall(
+            lambda node: isinstance(node, (nodes.math, nodes.math_block)))
+    }
+    if formulas:
+        get_env_store(app.env, 'mathcache_formulas')[app.env.docname] = (
+            formulas)
+
+
+def render_formulas(app, env):
+    builder = app.builder
+    if getattr(builder, 'math_renderer_name', None) != 'imgmath':
+        return
+    from sphinx.ext.imgmath import generate_latex_macro
+
+    config = app.config
+    image_format = config.imgmath_image_format.lower()
+    options = render_options(config, image_format)
+    cache_dir = os.path.abspath(
+        config.mathcache_dir or default_cache_dir(CACHE_ENVVAR, 'math'))
+    math_dir = os.path.join(builder.outdir, builder.imagedir, 'math')
+
+    formulas = set().union(
+        *get_env_store(env, 'mathcache_formulas').values())
+    jobs = {}
+    copies = []
+    for math in sorted(formulas):
+        latex = generate_latex_macro(image_format, math, config, app.confdir)
+        # the filename imgmath uses.
+        target = os.path.join(math_dir, '{0}.{1}'.format(
+            hashlib.sha1(latex.encode()).hexdigest(), image_format))
+        if os.path.isfile(target):
+            continue
+        cached = os.path.join(cache_dir, '{0}.{1}'.format(
+            cache_key(latex, options), image_format))
+        if not os.path.isfile(cached):
+            jobs[cached] = (latex, options, cached)
+        copies.append((cached, target))
+
+    if jobs:
+        workers = config.mathcache_workers
+        with ProcessPoolExecutor(
+                max_workers=int(workers) if workers else None) as pool:
+            list(pool.map(_render, jobs.values()))
+        logger.info(INFO_RENDERED.format(len(jobs), len(formulas)))
+
+    if copies:
+        os.makedirs(math_dir, exist_ok=True)
+    for cached, target in copies:
+        # formulas that failed are rendered by imgmath to report the error.
+        if os.path.isfile(cached):
+            shutil.copyfile(cached, target)
+
+
+def set_inline_svg(app, config):
+    if config.mathcache_inline_svg:
+        config.imgmath_image_format = 'svg'
+        config.imgmath_embed = True
+
+
+def setup(app):
+    app.setup_extension('sphinx.ext.imgmath')
+    app.add_config_value('mathcache_dir', None, '')
+    app.add_config_value('mathcache_workers', None, '')
+    app.add_config_value('mathcache_inline_svg', False, 'html')
+    app.connect('config-inited', set_inline_svg)
+    app.connect('doctree-read', collect_formulas)
+    per_document_env_store(app, 'mathcache_formulas')
+    app.connect('env-updated', render_formulas)
+
+    return {
+        'parallel_read_safe': True,
+    }
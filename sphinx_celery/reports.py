@@ -0,0 +1,101 @@
+"""Machine-readable reports for the check builders.
+
+Results are written one check at a time as they are produced,
+so that a report is usable even if the build fails half-way.
+
+Formats:
+
+- ``jsonl``: `JSON Lines`_, one object per result and a summary
+  object for every check.
+- ``junit``: JUnit XML, one ``<testsuite>`` for every check and domain.
+
+.. _`JSON Lines`: https://jsonlines.org
+
+"""
+
+import json
+import os
+from xml.sax.saxutils import escape, quoteattr
+
+__all__ = ['JSONLinesWriter', 'JUnitXMLWriter', 'REPORT_WRITERS']
+
+
+class ReportWriter:
+    extension = None
+
+    def __init__(self, outdir, name):
+        self.name = name
+        self.path = os.path.join(outdir, name + self.extension)
+        self.fh = open(self.path, mode='w', encoding='utf-8')
+        self.start()
+
+    def start(self):
+        pass
+
+    def close(self):
+        self.fh.close()
+
+
+class JSONLinesWriter(ReportWriter):
+    extension = '.jsonl'
+
+    def write_check(self, check, domain, failures, duration):
+        for failure in failures:
+            self.write_line({
+                'builder': self.name,
+                'check': check,
+                'domain': domain,
+                'name': failure,
+                'status': 'failed',
+            })
+        self.write_line({
+            'builder': self.name,
+            'check': check,
+            'domain': domain,
+            'status': 'failed' if failures else 'passed',
+            'failures': len(failures),
+            'time': round(duration, 6),
+        })
+        self.fh.flush()
+
+    def write_line(self, obj):
+        self.fh.write(json.dumps(obj, sort_keys=True))
+        self.fh.write('\n')
+
+
+class JUnitXMLWriter(ReportWriter):
+    extension = '.xml'
+
+    def start(self):
+        self.fh.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        self.fh.write(f'<testsuites name={quoteattr(self.name)}>\n')
+
+    def write_check(self, check, domain, failures, duration):
+        suite = '.'.join([self.name, domain, check])
+        self.fh.write(
+            f'  <testsuite name={quoteattr(suite)} '
+            f'tests="{len(failures) or 1}" failures="{len(failures)}" '
+            f'errors="0" time="{duration:.6f}">\n')
+        for failure in failures:
+            self.fh.write(
+                f'    <testcase classname={quoteattr(suite)} '
+                f'name={quoteattr(str(failure))}>\n'
+                f'      <failure message={quoteattr(check)}>'
+                f'{escape(str(failure))}</failure>\n'
+                f'    </testcase>\n')
+        if not failures:
+            self.fh.write(
+                f'    <testcase classname={quoteattr(suite)} '
+                f'name={quoteattr(check)} time="{duration:.6f}"/>\n')
+        self.fh.write('  </testsuite>\n')
+        self.fh.flush()
+
+    def close(self):
+        self.fh.write('</testsuites>\n')
+        super().close()
+
+
+REPORT_WRITERS = {
+    'jsonl': JSONLinesWriter,
+    'junit': JUnitXMLWriter,
+}
@@ -0,0 +1,155 @@
+"""
+
+Sharded Search Index
+====================
+
+Splits the full-text terms of the search index into shards by term
+prefix, so that the search page only downloads the shards for the
+words searched for, instead of all of ``searchindex.js``.
+
+``searchindex/manifest.js`` has the rest of the index (documents,
+titles and objects) and maps term prefixes to shards, and the shards
+are ``searchindex/shard-<n>.js``.  Both are loaded with ``<script>``
+elements, like ``searchindex.js``, so search also works when the
+documentation is opened from ``file://``.
+
+The search page is then rendered with the ``searchshards.html``
+template, which extends ``search.html``.  ``searchindex.js`` is still
+written, as Sphinx reads it back for incremental builds.
+
+Words are only matched partially (e.g. ``celer`` matching ``celery``)
+against terms that share their prefix.
+
+Theme Options
+-------------
+
+search_shards
+~~~~~~~~~~~~~
+
+Set to ``true`` in ``html_theme_options`` to use the sharded index
+on the search page.
+
+Default is ``false``.
+
+search_shard_prefix
+~~~~~~~~~~~~~~~~~~~
+
+Number of leading characters of terms used to select shards.
+
+Default is ``2``.
+
+search_shard_size
+~~~~~~~~~~~~~~~~~
+
+Approximate size of shards in bytes, prefixes are grouped into
+shards up to this size.
+
+Default is ``65536``.
+
+"""
+
+import json
+import os
+import re
+
+from sphinx.search import js_index
+from sphinx.util import logging
+
+from .cssbundle import is_enabled
+
+__all__ = ['shard_index']
+
+TEMPLATE = 'searchshards.html'
+SHARD_DIR = 'searchindex'
+MANIFEST_FILENAME = 'manifest.js'
+SHARD_FILENAME = 'shard-{0}.js'
+RE_SHARD = re.compile(r'^shard-\d+\.js$')
+
+MANIFEST_FORMAT = 'Search.setIndex({0})'
+SHARD_FORMAT = 'SearchShards.setShard({0},{1})'
+
+TERM_KEYS = ('terms', 'titleterms')
+
+INFO_SHARDS = 'searchshards: Wrote {0} shards of {1} terms'
+
+logger = logging.getLogger(__name__)
+
+
+def dumps(data):
+    return json.dumps(data, separators=(',', ':'), sort_keys=True)
+
+
+def shard_index(index, prefix_length=2, shard_size=65536):
+    """Split the terms of a search *index* into shards.
+
+    Returns the manifest, with the terms replaced by a mapping of
+    prefix to shard number (``shards``), and the list of shards.
+    """
+    by_prefix = {}
+    for key in TERM_KEYS:
+        for term, files in index.get(key, {}).items():
+            by_prefix.setdefault(term[:prefix_length], {
+                k: {} for k in TERM_KEYS})[key][term] = files
+
+    prefixes = {}
+    shards = []
+    size = shard_size
+    for prefix, terms in sorted(by_prefix.items()):
+        terms_size = len(dumps(terms))
+        if size + terms_size > shard_size:
+            shards.append({k: {} for k in TERM_KEYS})
+            size = 0
+        for key in TERM_KEYS:
+            shards[-1][key].update(terms[key])
+        size += terms_size
+        prefixes[prefix] = len(shards) - 1
+
+    manifest = dict(index, **{k: {} for k in TERM_KEYS})
+    manifest['shards'] = prefixes
+    manifest['shardprefix'] = prefix_length
+    return manifest, shards
+
+
+def select_template(app, pagename, templatename, context, doctree):
+    if templatename == 'search.html' and is_enabled(
+            context.get('theme_search_shards')):
+        return TEMPLATE
+
+
+def write_shards(app, exception):
+    builder = app.builder
+    theme = getattr(builder, 'theme', None)
+    if exception is not None or theme is None or not getattr(
+            builder, 'indexer', None):
+        return
+    options = theme.get_options(builder.theme_options)
+    if not is_enabled(options.get('search_shards')):
+        return
+    try:
+        with open(os.path.join(builder.outdir, builder.searchindex_filename),
+                  encoding='utf-8') as fh:
+            index = js_index.loads(fh.read())
+    except (OSError, ValueError):
+        return
+    manifest, shards = shard_index(
+        index,
+        prefix_length=int(options.get('search_shard_prefix') or 2),
+        shard_size=int(options.get('search_shard_size') or 65536),
+    )
+
+    shard_dir = os.path.join(builder.outdir, SHARD_DIR)
+    os.makedirs(shard_dir, exist_ok=True)
+    filenames = {MANIFEST_FILENAME}
+    for i, shard in enumerate(shards):
+        filenames.add(SHARD_FILENAME.format(i))
+        with open(os.path.join(shard_dir, SHARD_FILENAME.format(i)), 'w',
+                  encoding='utf-8') as fh:
+            fh.write(SHARD_FORMAT.format(i, dumps(shard)))
+    with open(os.path.join(shard_dir, MANIFEST_FILENAME), 'w',
+              encoding='utf-8') as fh:
+        fh.write(MANIFEST_FORMAT.format(dumps(manifest)))
+    for name in os.listdir(shard_dir):
+        if RE_SHARD.match(name) and name not in filenames:
+            os.unlink(os.path.join(shard_dir, name))
+    logger.info(INFO_SHARDS.format(
+        len(shards), sum(len(index.get(k, {})) for k in TERM_KEYS)))
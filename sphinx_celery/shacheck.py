@@ -0,0 +1,214 @@
+"""
+
+Sphinx Commit Reference Checker
+===============================
+
+This extension verifies the targets of the ``sha`` and ``github_branch``
+extlinks (e.g. ``:sha:`a1b2c3d```) against a local clone of the
+project, so that typos in commit SHAs are reported by the build.
+
+Targets are collected while documents are read, and then all looked
+up at once by a single ``git cat-file --batch-check`` process,
+while branches are read by a single ``git for-each-ref``.
+
+Configuration
+-------------
+
+shacheck_repository
+~~~~~~~~~~~~~~~~~~~
+
+Path to a local clone of the project.  Nothing is checked
+if this is not set.
+
+Default is :const:`None`.
+
+shacheck_roles
+~~~~~~~~~~~~~~
+
+Mapping of extlink names to the kind of target, either
+``commit`` or ``branch``.
+
+Default is ``{'sha': 'commit', 'github_branch': 'branch'}``.
+
+shacheck_expand
+~~~~~~~~~~~~~~~
+
+Link to the full SHA of commits referenced by a short SHA.
+The text of the link is not changed.
+
+Default is :const:`True`.
+
+"""
+
+import os
+import subprocess
+
+from docutils import nodes
+from sphinx.util import logging
+
+from .git import git
+from .utils import get_env_store, per_document_env_store
+
+__all__ = ['find_branches', 'resolve_commits']
+
+ERR_UNKNOWN_COMMIT = 'shacheck: Unknown commit {0!r}'
+ERR_AMBIGUOUS_COMMIT = 'shacheck: Ambiguous short SHA {0!r}'
+ERR_NOT_A_COMMIT = 'shacheck: {0!r} is a {1}, not a commit'
+ERR_UNKNOWN_BRANCH = 'shacheck: Unknown branch {0!r}'
+ERR_GIT = 'shacheck: Cannot read {0}: {1}'
+
+BRANCH_PREFIXES = ('refs/heads/', 'refs/tags/')
+REMOTE_PREFIX = 'refs/remotes/'
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_commits(names, repository):
+    """Look up object *names* in *repository*.
+
+    Returns a mapping of name to ``(full_sha, type)``, or to
+    ``(None, 'missing')`` and ``(None, 'ambiguous')`` for unknown
+    and ambiguous names.  Names of tags are peeled to the commit
+    they point to.
+    """
+    names = sorted(set(names))
+    if not names:
+        return {}
+    # the type of the object, and the commit it's peeled to.
+    output = git(
+        ['cat-file', '--batch-check'],
+        cwd=repository,
+        input=''.join(f'{name}\n{name}^{{commit}}\n' for name in names),
+    ).splitlines()
+    resolved = {}
+    for name, line, peeled in zip(names, output[::2], output[1::2]):
+        fields, peeled = line.split(), peeled.split()
+        if fields[-1] in ('missing', 'ambiguous'):
+            resolved[name] = (None, fields[-1])
+        elif peeled[-1] not in ('missing', 'ambiguous'):
+            resolved[name] = (peeled[0], peeled[1])
+        else:
+            resolved[name] = (fields[0], fields[1])
+    return resolved
+
+
+def find_branches(repository):
+    """Return names of local and remote branches, and tags."""
+    branches = set()
+    output = git(
+        ['for-each-ref', '--format=%(refname)',
+         'refs/heads', 'refs/remotes', 'refs/tags'],
+        cwd=repository,
+    )
+    for ref in output.splitlines():
+        if ref.startswith(BRANCH_PREFIXES):
+            branches.add(ref.split('/', 2)[2])
+        elif ref.startswith(REMOTE_PREFIX):
+            # refs/remotes/origin/main
+            branches.add(ref.split('/', 3)[-1])
+    return branches
+
+
+def get_extlink_base(config, name):
+    try:
+        return config.extlinks[name][0].split('%s')[0]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def collect_references(app, doctree):
+    env = app.env
+    roles = app.config.shacheck_roles
+    if not roles:
+        return
+    bases = {
+        name: get_extlink_base(app.config, name) for name in roles
+    }
+    references = []
+    for node in doctree.findall(nodes.reference):
+        for name, base in bases.items():
+            if base and f'extlink-{name}' in node['classes']:
+                target = node['refuri'][len(base):]
+                references.append(
+                    (roles[name], target, get_node_line(node)))
+                break
+    if references:
+        get_env_store(env, 'shacheck_references')[env.docname] = references
+
+
+def get_node_line(node):
+    while node is not None and node.line is None:
+        node = node.parent
+    return node.line if node is not None else None
+
+
+def verify_references(app, env):
+    repository = app.config.shacheck_repository
+    references = get_env_store(env, 'shacheck_references')
+    app.shacheck_commits = {}
+    if not repository or not references:
+        return
+    repository = os.path.join(app.confdir, repository)
+    targets = {
+        kind: {target for items in references.values()
+               for k, target, _ in items if k == kind}
+        for kind in ('commit', 'branch')
+    }
+    try:
+        commits = resolve_commits(targets['commit'], repository)
+        branches = (find_branches(repository)
+                    if targets['branch'] else set())
+    except (OSError, subprocess.CalledProcessError) as exc:
+        logger.warning(ERR_GIT.format(
+            repository, getattr(exc, 'stderr', None) or exc))
+        return
+    for docname, items in sorted(references.items()):
+        for kind, target, line in items:
+            error = None
+            if kind == 'branch':
+                if target not in branches:
+                    error = ERR_UNKNOWN_BRANCH.format(target)
+            else:
+                sha, objtype = commits[target]
+                if objtype == 'missing':
+                    error = ERR_UNKNOWN_COMMIT.format(target)
+                elif objtype == 'ambiguous':
+                    error = ERR_AMBIGUOUS_COMMIT.format(target)
+                elif objtype != 'commit':
+                    error = ERR_NOT_A_COMMIT.format(target, objtype)
+                elif sha != target:
+                    app.shacheck_commits[target] = sha
+            if error is not None:
+                logger.warning(error, location=(docname, line))
+
+
+def expand_references(app, doctree, docname):
+    commits = getattr(app, 'shacheck_commits', None)
+    if not commits or not app.config.shacheck_expand:
+        return
+    for name, kind in app.config.shacheck_roles.items():
+        base = get_extlink_base(app.config, name)
+        if kind != 'commit' or not base:
+            continue
+        for node in doctree.findall(nodes.reference):
+            if f'extlink-{name}' not in node['classes']:
+                continue
+            target = node['refuri'][len(base):]
+            if target in commits:
+                node['refuri'] = node['refuri'].replace(
+                    target, commits[target], 1)
+
+
+def setup(app):
+    app.add_config_value('shacheck_repository', None, '')
+    app.add_config_value(
+        'shacheck_roles', {'sha': 'commit', 'github_branch': 'branch'}, 'env')
+    app.add_config_value('shacheck_expand', True, 'html')
+    app.connect('doctree-read', collect_references)
+    per_document_env_store(app, 'shacheck_references')
+    app.connect('env-updated', verify_references)
+    app.connect('doctree-resolved', expand_references)
+
+    return {
+        'parallel_read_safe': True,
+    }
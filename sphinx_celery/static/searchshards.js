@@ -0,0 +1,56 @@
+/*
+ * searchshards.js
+ * ~~~~~~~~~~~~~~~
+ *
+ * Loads the shards of the search index written by
+ * sphinx_celery.searchshards for the words searched for.
+ *
+ * Shards are loaded with script elements, so that search also
+ * works for documentation opened from file://.
+ */
+"use strict";
+
+const SearchShards = {
+  _baseURL: new URL("../searchindex/", document.currentScript.src),
+  _shards: new Map(),
+  _resolve: new Map(),
+
+  shardsFor: (words) => {
+    const index = Search._index;
+    const ids = new Set();
+    words.forEach((word) => {
+      const prefix = word.slice(0, index.shardprefix);
+      if (index.shards.hasOwnProperty(prefix)) ids.add(index.shards[prefix]);
+    });
+    return [...ids];
+  },
+
+  load: (id) => {
+    if (!SearchShards._shards.has(id)) {
+      SearchShards._shards.set(id, new Promise((resolve) => {
+        SearchShards._resolve.set(id, resolve);
+        const script = document.createElement("script");
+        script.src = new URL(`shard-${id}.js`, SearchShards._baseURL).href;
+        // search without the shard rather than not at all.
+        script.onerror = () => resolve();
+        document.body.appendChild(script);
+      }));
+    }
+    return SearchShards._shards.get(id);
+  },
+
+  setShard: (id, shard) => {
+    Object.assign(Search._index.terms, shard.terms);
+    Object.assign(Search._index.titleterms, shard.titleterms);
+    const resolve = SearchShards._resolve.get(id);
+    if (resolve) resolve();
+  },
+};
+
+const _searchQuery = Search.query;
+Search.query = (query) => {
+  if (!Search._index.shards) return _searchQuery(query);
+  const [, searchTerms, excludedTerms] = Search._parseQuery(query);
+  const ids = SearchShards.shardsFor([...searchTerms, ...excludedTerms]);
+  Promise.all(ids.map(SearchShards.load)).then(() => _searchQuery(query));
+};
@@ -1,5 +1,72 @@
-__all__ = ['bytes_if_py2']
+import os
+from contextlib import contextmanager
+
+__all__ = [
+    'bytes_if_py2', 'default_cache_dir', 'atomic_write',
+    'get_env_store', 'per_document_env_store',
+]
 
 
 def bytes_if_py2(s):
     return s
+
+
+def default_cache_dir(envvar, name):
+    """Return ``$envvar``, or *name* in the user cache directory."""
+    path = os.environ.get(envvar)
+    if path:
+        return path
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'sphinx_celery', name)
+
+
+@contextmanager
+def atomic_write(path, mode='w', **kwargs):
+    """Open a temporary file that replaces *path* when closed.
+
+    The temporary file is named after the process, so that builds
+    writing the same file concurrently do not clobber each other.
+    """
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, mode, **kwargs) as fh:
+            yield fh
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    os.replace(tmp, path)
+
+
+def get_env_store(env, attr):
+    """Return the mapping of docname to data ``env.<attr>``."""
+    try:
+        return getattr(env, attr)
+    except AttributeError:
+        store = {}
+        setattr(env, attr, store)
+        return store
+
+
+def per_document_env_store(app, attr):
+    """Keep data collected while reading documents in ``env.<attr>``.
+
+    The data is kept by document, so that it can be merged from the
+    environments of parallel reads, and purged when a document is
+    read again or removed.
+    """
+    def purge(app, env, docname):
+        get_env_store(env, attr).pop(docname, None)
+
+    def merge(app, env, docnames, other):
+        store = get_env_store(env, attr)
+        other_store = getattr(other, attr, {})
+        for docname in docnames:
+            if docname in other_store:
+                store[docname] = other_store[docname]
+
+    app.connect('env-purge-doc', purge)
+    app.connect('env-merge-info', merge)
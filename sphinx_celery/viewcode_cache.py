@@ -0,0 +1,127 @@
+"""
+
+Incremental Source Pages
+========================
+
+Only generates the highlighted source pages of :mod:`sphinx.ext.viewcode`
+(``_modules/*``) again when the source of the module changed.
+
+:mod:`sphinx.ext.viewcode` compares the modification time of the module
+to that of the page, so all pages are generated again after a fresh
+checkout, while pages are not updated when only the objects documented
+(and so the ``[docs]`` links) change.  Instead, the hash of the module
+source, the links and the build configuration is recorded for every
+page in a manifest in the doctree directory, and the modules of
+unchanged pages are hidden from :mod:`~sphinx.ext.viewcode` while it
+collects its pages.
+
+Enabled by passing ``source_pages='incremental'`` to
+:func:`sphinx_celery.conf.build_config`.
+
+"""
+
+import hashlib
+import json
+import os
+
+import sphinx
+from sphinx.ext import viewcode
+
+__all__ = ['page_digest']
+
+MANIFEST_FILENAME = 'viewcode_manifest.json'
+
+
+def page_digest(entry, extra=()):
+    """Return the hash of a :mod:`~sphinx.ext.viewcode` module entry."""
+    code, tags, used, refname = entry
+    return hashlib.sha1(json.dumps(
+        [code, tags, used, refname, list(extra)],
+        sort_keys=True, default=repr,
+    ).encode('utf-8')).hexdigest()
+
+
+def config_digest(app):
+    build_info = getattr(app.builder, 'build_info', None)
+    return [
+        sphinx.__display_version__,
+        app.builder.name,
+        getattr(build_info, 'config_hash', ''),
+        app.config.highlight_language,
+        app.config.pygments_style,
+        getattr(app.config, 'viewcode_line_numbers', False),
+    ]
+
+
+def get_manifest_path(app):
+    return os.path.join(app.doctreedir, MANIFEST_FILENAME)
+
+
+def load_manifest(app):
+    try:
+        with open(get_manifest_path(app)) as fh:
+            app.viewcode_manifest = json.load(fh)
+    except (OSError, ValueError):
+        app.viewcode_manifest = {}
+
+
+def save_manifest(app, exception):
+    manifest = getattr(app, 'viewcode_manifest', None)
+    if exception is not None or manifest is None:
+        return
+    modules = getattr(app.env, '_viewcode_modules', {})
+    with open(get_manifest_path(app), 'w') as fh:
+        json.dump(
+            {k: v for k, v in manifest.items() if modules.get(k)},
+            fh, indent=1, sort_keys=True)
+
+
+def skip_unchanged_pages(app):
+    manifest = getattr(app, 'viewcode_manifest', None)
+    modules = getattr(app.env, '_viewcode_modules', None)
+    if manifest is None or not modules:
+        return []
+    if (app.builder.name.startswith('epub') and
+            not app.config.viewcode_enable_epub):
+        return []
+    extra = config_digest(app)
+    app.viewcode_skipped = {}
+    for modname, entry in list(modules.items()):
+        if not entry:
+            continue
+        digest = page_digest(entry, extra)
+        page = os.path.join(
+            app.outdir, viewcode.OUTPUT_DIRNAME,
+            modname.replace('.', '/') + app.builder.out_suffix)
+        if manifest.get(modname) == digest and os.path.exists(page):
+            # viewcode skips modules without an entry.
+            app.viewcode_skipped[modname] = entry
+            modules[modname] = False
+            continue
+        manifest[modname] = digest
+        if os.path.exists(page):
+            # so the page is not skipped for being newer than the module.
+            os.utime(page, (0, 0))
+    return []
+
+
+def restore_skipped_pages(app):
+    # iterated after the pages of viewcode are generated.
+    skipped = getattr(app, 'viewcode_skipped', None)
+    if skipped:
+        app.env._viewcode_modules.update(skipped)
+        app.viewcode_skipped = {}
+    yield from ()
+
+
+def setup(app):
+    app.setup_extension('sphinx.ext.viewcode')
+    app.connect('builder-inited', load_manifest)
+    # around the html-collect-pages handler of viewcode (priority 500).
+    app.connect('html-collect-pages', skip_unchanged_pages, priority=400)
+    app.connect('html-collect-pages', restore_skipped_pages, priority=600)
+    app.connect('build-finished', save_manifest)
+
+    return {
+        'parallel_read_safe': True,
+    }
@@ -0,0 +1,260 @@
+"""
+
+Sphinx Celery Reference Watcher
+===============================
+
+Long-running version of :mod:`sphinx_celery.check` for local work.
+
+The pickled build environment (if any) and the discovered modules
+and settings are kept in memory, and the package and documentation
+trees are polled for changes.  Only the documents and directories that
+changed are scanned again, and the ``apicheck`` and ``configcheck``
+builders then report what changed since the last time.
+
+Python modules of the package that change are reloaded so that
+new settings are picked up by ``configcheck_project_settings``.
+
+Usage
+-----
+
+.. code-block:: console
+
+    $ python -m sphinx_celery.watch -d docs/_build/doctrees docs/
+
+"""
+
+import argparse
+import importlib
+import os
+import sys
+import time
+
+from sphinx.util.console import bold, darkgreen, green, red
+
+from .apicheck import APICheckBuilder, ModuleIndex, locate_module
+from .builders import create_builder
+from .check import (CHECK_BUILDERS, DEFAULT_OUTDIR, create_app, find_sources,
+                    parse_define, prescan_document, purge_document)
+
+DEFAULT_INTERVAL = 1.0
+
+DEFAULT_DOCTREEDIR = os.path.join('_build', 'doctrees')
+
+ENV_PICKLE_FILENAME = 'environment.pickle'
+
+STATUS_FORMAT = '{name}: {total} undocumented ({elapsed:.1f} ms)'
+ADDED_FORMAT = '{sign} {name} is not documented'
+REMOVED_FORMAT = '{sign} {name} is now documented'
+
+
+class Watcher:
+    """Poll the package and documentation, and report coverage deltas."""
+
+    def __init__(self, app, builders=CHECK_BUILDERS,
+                 interval=DEFAULT_INTERVAL, out=None):
+        self.app = app
+        self.env = app.env
+        self.interval = interval
+        self.out = out or sys.stdout
+        self.builders = [
+            app.builder if app.builder.name == name
+            else create_builder(app, name)
+            for name in builders
+        ]
+        config = app.config
+        self.package = config.apicheck_package or config.project.lower()
+        self.domains = next((
+            builder.check_domains for builder in self.builders
+            if builder.name == APICheckBuilder.name
+        ), ['py'])
+        self.module_index = ModuleIndex()
+        self.sources = {}
+        self.module_mtimes = {}
+        self.module_paths = {}
+        self.modules = {}
+        self.settings = None
+        self.undocumented = {}
+
+    def run(self):
+        start = time.monotonic()
+        self.prime()
+        self.check(start)
+        try:
+            while True:
+                time.sleep(self.interval)
+                start = time.monotonic()
+                if self.poll():
+                    self.check(start)
+        except KeyboardInterrupt:
+            pass
+        return self.app.statuscode
+
+    def prime(self):
+        # Documents read into the pickled environment do not need
+        # to be scanned, unless they changed after it was written.
+        envfile = os.path.join(self.app.doctreedir, ENV_PICKLE_FILENAME)
+        env_mtime = (os.stat(envfile).st_mtime
+                     if os.path.exists(envfile) else None)
+        for docname, path in find_sources(self.app.srcdir, self.app.config):
+            mtime = os.stat(path).st_mtime
+            if env_mtime is None or mtime > env_mtime or (
+                    docname not in self.env.all_docs):
+                purge_document(self.env, docname)
+                prescan_document(self.env, docname, path)
+            self.sources[docname] = (path, mtime)
+        # documents removed after it was written.
+        for docname in set(self.env.all_docs) - set(self.sources):
+            purge_document(self.env, docname)
+            del self.env.all_docs[docname]
+        self.poll_package()
+
+    def poll(self):
+        return any([self.poll_docs(), self.poll_package()])
+
+    def poll_docs(self):
+        changed = False
+        seen = set()
+        for docname, path in find_sources(self.app.srcdir, self.app.config):
+            seen.add(docname)
+            mtime = os.stat(path).st_mtime
+            if self.sources.get(docname, (None, None))[1] != mtime:
+                purge_document(self.env, docname)
+                prescan_document(self.env, docname, path)
+                self.sources[docname] = (path, mtime)
+                changed = True
+        for docname in set(self.sources) - seen:
+            purge_document(self.env, docname)
+            del self.sources[docname]
+            changed = True
+        return changed
+
+    def poll_package(self):
+        changed = self.poll_modules()
+        for builder in self.builders:
+            if builder.name == 'configcheck':
+                changed = self.poll_settings(builder) or changed
+        return changed
+
+    def poll_modules(self):
+        changed = False
+        for domain in self.domains:
+            modules = set(APICheckBuilder.find_modules[domain](
+                self.package, index=self.module_index,
+            ))
+            if modules != self.modules.get(domain):
+                self.modules[domain] = modules
+                changed = True
+        return changed
+
+    def poll_settings(self, builder):
+        changed = self.settings is None
+        for module in sorted(set().union(*self.modules.values())):
+            path = self.module_paths.get(module)
+            if path is None:
+                try:
+                    path = self.module_paths[module] = locate_module(
+                        module)[1]
+                except ImportError:
+                    continue
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            previous = self.module_mtimes.get(module)
+            self.module_mtimes[module] = mtime
+            if previous is not None and previous != mtime:
+                changed = True
+                if module in sys.modules:
+                    try:
+                        importlib.reload(sys.modules[module])
+                    except Exception as exc:
+                        print(red(f'Cannot reload {module}: {exc!r}'),
+                              file=self.out)
+        if changed:
+            self.settings = set(builder.project_settings())
+        return changed
+
+    def check(self, start):
+        # elapsed time includes scanning what changed.
+        for builder in self.builders:
+            undocumented = self.find_undocumented(builder)
+            elapsed = (time.monotonic() - start) * 1000.0
+            self.report(builder.name, undocumented, elapsed)
+
+    def find_undocumented(self, builder):
+        if builder.name == 'apicheck':
+            undocumented = set()
+            for domain in builder.check_domains:
+                builder.all_modules[domain] = self.modules[domain]
+                undocumented.update(builder.find_undocumented(
+                    domain, self.env.domaindata[domain]['modules'],
+                ))
+            return undocumented
+        return set(builder.find_undocumented(
+            self.settings, builder.documented_settings(),
+        ))
+
+    def report(self, name, undocumented, elapsed):
+        previous = self.undocumented.get(name)
+        self.undocumented[name] = undocumented
+        self.app.statuscode = 2 if any(self.undocumented.values()) else 0
+        if previous is None:
+            added, removed = undocumented, set()
+        else:
+            added, removed = undocumented - previous, previous - undocumented
+        if previous is not None and not added and not removed:
+            return
+        status = STATUS_FORMAT.format(
+            name=bold(name), total=len(undocumented), elapsed=elapsed)
+        print(red(status) if undocumented else green(status), file=self.out)
+        for item in sorted(added):
+            print(ADDED_FORMAT.format(
+                sign=red('+'), name=darkgreen(item)), file=self.out)
+        for item in sorted(removed):
+            print(REMOVED_FORMAT.format(
+                sign=green('-'), name=darkgreen(item)), file=self.out)
+        self.out.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m sphinx_celery.watch',
+        description='Watch API and configuration reference coverage.',
+    )
+    parser.add_argument('sourcedir')
+    parser.add_argument(
+        'outdir', nargs='?',
+        help=f'report directory (default: SOURCEDIR/{DEFAULT_OUTDIR})')
+    parser.add_argument(
+        '-b', dest='builders', action='append', choices=CHECK_BUILDERS,
+        help='check to run (default: all)')
+    parser.add_argument(
+        '-c', dest='confdir', help='directory containing conf.py')
+    parser.add_argument(
+        '-d', dest='doctreedir',
+        help='directory of the pickled environment '
+             f'(default: SOURCEDIR/{DEFAULT_DOCTREEDIR})')
+    parser.add_argument(
+        '-D', dest='define', action='append', default=[], type=parse_define,
+        metavar='setting=value', help='override a setting in conf.py')
+    parser.add_argument(
+        '-i', '--interval', type=float, default=DEFAULT_INTERVAL,
+        help=f'seconds between polls (default: {DEFAULT_INTERVAL})')
+    args = parser.parse_args(argv)
+
+    builders = args.builders or CHECK_BUILDERS
+    app = create_app(
+        args.sourcedir,
+        args.outdir or os.path.join(args.sourcedir, DEFAULT_OUTDIR),
+        confdir=args.confdir,
+        doctreedir=(args.doctreedir or
+                    os.path.join(args.sourcedir, DEFAULT_DOCTREEDIR)),
+        buildername=builders[0],
+        confoverrides=dict(args.define),
+        freshenv=False,
+    )
+    return Watcher(app, builders, interval=args.interval).run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())